@@ -1,9 +1,63 @@
+"""Cola de corrección, con estimación de espera y control de admisión.
+
+Cuando hay más de `max_backlog` entregas esperando en la cola principal (p. ej.
+cerca de una fecha de entrega), las nuevas entregas se archivan igual pero su
+corrección se posterga: van a la cola `<job_queue>_deferred`, que los workers
+atienden solo cuando la cola principal está vacía.
+
+Las re-correcciones masivas (ver algorw.app.recorregir) van a una tercera cola,
+`<job_queue>_low`, que se atiende solo cuando las otras dos están vacías.
+"""
+
+import math
+
+from typing import NamedTuple, Optional
+
 from redis import Redis
-from rq import Queue  # type: ignore
+from rq import Queue, Worker  # type: ignore
 
+from algorw.common import metrics
 from config import load_config
 
 
 settings = load_config()
 redis_conn = Redis()
 task_queue = Queue(settings.job_queue, connection=redis_conn)
+deferred_queue = Queue(f"{settings.job_queue}_deferred", connection=redis_conn)
+low_priority_queue = Queue(f"{settings.job_queue}_low", connection=redis_conn)
+
+# Duración estimada de una corrección si aún no hay mediciones para el TP.
+DEFAULT_JOB_SECONDS = 30.0
+
+
+class QueueStatus(NamedTuple):
+    position: int  # Cantidad de entregas por delante, incluyendo esta.
+    eta_seconds: Optional[float]
+    deferred: bool
+
+
+def enqueue_task(func, task, *, tp_id: str, job_id: str) -> QueueStatus:
+    """Encola una corrección, postergándola si la cola está saturada.
+
+    Returns:
+      la posición en la cola y el tiempo estimado hasta que termine.
+    """
+    deferred = len(task_queue) >= settings.max_backlog
+    queue = deferred_queue if deferred else task_queue
+    queue.enqueue(func, task, job_id=job_id)
+
+    position = len(task_queue) + (len(deferred_queue) if deferred else 0)
+    return QueueStatus(position, estimate_wait(tp_id, position), deferred)
+
+
+def estimate_wait(tp_id: str, position: int) -> Optional[float]:
+    """Estima el tiempo (en segundos) hasta que termine la entrega en `position`.
+
+    Se usa la duración promedio de las últimas correcciones del TP, y se supone
+    que los workers activos se reparten la cola por igual.
+    """
+    workers = Worker.count(queue=task_queue)
+    if workers == 0:
+        return None
+    job_seconds = metrics.mean(f"job_seconds:{tp_id}") or DEFAULT_JOB_SECONDS
+    return math.ceil(position / workers) * job_seconds
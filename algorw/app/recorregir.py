@@ -0,0 +1,232 @@
+"""Re-corrección de todas las entregas de un TP (p.ej. tras corregir sus pruebas).
+
+Uso:
+
+    python -m algorw.app.recorregir TP_ID [--cuatri 2020_1] [--dry-run]
+                                          [--force] [--no-wait]
+
+Se toma la última entrega de cada alumne o grupo del repositorio de entregas
+(cada directorio contiene siempre la última versión), y se la encola en la
+cola de baja prioridad (ver algorw.app.queue), con su resultado anterior (de
+README.md): la respuesta por mail solo se envía si el resultado cambió (ver
+CorrectorTask.previous_ok). Las justificaciones de ausencia no se re-corrigen.
+
+El asunto de la respuesta es el del mail original, que se guarda en el último
+commit de la entrega (ver SUBJECT_TRAILER); para las entregas archivadas antes
+de que existiera, se usa "<TP> - <legajos>".
+
+Cada entrada (archivos de la entrega y base del TP) se encola una sola vez: si
+se vuelve a ejecutar el comando sin cambios en skel, o tras una interrupción,
+solo se encolan las entregas que faltan (con --force, se encolan todas).
+
+Salvo con --no-wait, se informa el avance y la cantidad de correcciones por
+minuto hasta que terminan todas.
+"""
+
+import argparse
+import email.utils
+import hashlib
+import pathlib
+import subprocess
+import sys
+import time
+import uuid
+
+from typing import List, Optional
+
+from rq.job import Job  # type: ignore
+
+from ..common.tasks import CorrectorTask
+from ..corrector import skel_cache
+from ..corrector.commit_index import CommitIndex
+from ..corrector.corrector import SKEL_DIR, SUBJECT_TRAILER, TODO_OK_REGEX
+from ..corrector.export import GENERATED_FILES, entregas_relpath, zip_entrega
+from ..corrector.shards import locate
+from .queue import low_priority_queue, redis_conn, settings
+
+
+CORREGIR_ENTREGA = "algorw.app.tasks.corregir_entrega"
+
+# Entradas ya encoladas, para no encolarlas dos veces.
+ENQUEUED_KEY = "entregas:recorregir:{}"
+ENQUEUED_TTL = 30 * 24 * 3600
+
+POLL_INTERVAL = 5
+
+RECORRECCION = " (re-corrección)"
+
+
+def load_task(
+    entrega_dir: pathlib.Path, relpath: pathlib.PurePosixPath
+) -> Optional[CorrectorTask]:
+    """Arma la tarea de re-corrección de una entrega archivada.
+
+    Args:
+      entrega_dir: el directorio de la entrega.
+      relpath: su ruta en el repositorio de entregas (p.ej. pila/2020_1/54321).
+
+    Returns:
+      la tarea, o None si la entrega nunca se corrigió (p.ej. una ausencia).
+    """
+    readme = entrega_dir / "README.md"
+    if not readme.is_file():
+        return None
+    # README.md contiene la salida anterior, entre "```" (ver Moss.save_output).
+    previous_output = readme.read_text("utf-8")
+    if previous_output.startswith("```\n"):
+        previous_output = previous_output[4:]
+    if previous_output.endswith("```"):
+        previous_output = previous_output[:-3]
+
+    tp_id = entrega_dir.parent.name if _is_parcialito(relpath) else relpath.parts[0]
+    legajos = entrega_dir.name.split("_")
+    subject = archived_subject(entrega_dir, relpath)
+    if subject is None:
+        subject = f"{tp_id} - {', '.join(legajos)}"
+    return CorrectorTask(
+        tp_id=tp_id,
+        legajos=legajos,
+        zipfile=zip_entrega(entrega_dir),
+        orig_headers={
+            "Subject": f"{subject}{RECORRECCION}",
+            "Date": email.utils.formatdate(),
+            "Message-ID": email.utils.make_msgid(),
+        },
+        repo_relpath=relpath,
+        job_id=uuid.uuid4().hex,
+        previous_ok=TODO_OK_REGEX.search(previous_output) is not None,
+    )
+
+
+def archived_subject(
+    entrega_dir: pathlib.Path, relpath: pathlib.PurePosixPath
+) -> Optional[str]:
+    """Devuelve el asunto del mail original de una entrega, si está archivado.
+
+    Se toma del último commit de la entrega (sin el sufijo de re-corrección).
+    """
+    with CommitIndex(entrega_dir) as index:
+        shas = index.commits_since(relpath.as_posix(), 0)
+    if not shas:
+        return None
+    trailer = f"--format=%(trailers:key={SUBJECT_TRAILER},valueonly,separator=)"
+    subject = subprocess.run(
+        ["git", "show", "-s", trailer, shas[-1]],
+        cwd=entrega_dir,
+        check=True,
+        capture_output=True,
+        encoding="utf-8",
+    ).stdout.strip()
+    if subject.endswith(RECORRECCION):
+        subject = subject[: -len(RECORRECCION)]
+    return subject or None
+
+
+def input_hash(entrega_dir: pathlib.Path, skel_hash: str) -> str:
+    """Devuelve un hash de la entrada de una corrección: entrega y base del TP.
+    """
+    digest = hashlib.sha256(f"{entrega_dir}\0{skel_hash}\0".encode("utf-8"))
+    for path in sorted(entrega_dir.rglob("*")):
+        relpath = path.relative_to(entrega_dir).as_posix()
+        if path.is_file() and relpath not in GENERATED_FILES:
+            digest.update(relpath.encode("utf-8") + b"\0")
+            digest.update(path.read_bytes())
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def enqueue_all(
+    tp_id: str, cuatri: str, *, dry_run: bool = False, force: bool = False
+) -> List[str]:
+    """Encola la re-corrección de todas las entregas de un TP.
+
+    Args:
+      dry_run: no encolar nada, solo informar cuántas ya estaban encoladas.
+      force: encolar también las que ya se encolaron con la misma entrada.
+
+    Returns:
+      los identificadores de los trabajos encolados.
+    """
+    base_relpath = entregas_relpath(tp_id, cuatri)
+    base_dir = locate(base_relpath)
+    skel_dir = SKEL_DIR / tp_id
+    skel_hash = skel_cache.skel_hash(skel_dir) if skel_dir.is_dir() else ""
+    job_ids = []
+    skipped = duplicates = 0
+
+    for entrega_dir in sorted(p for p in base_dir.iterdir() if p.is_dir()):
+        task = load_task(entrega_dir, base_relpath / entrega_dir.name)
+        if task is None:
+            skipped += 1
+            continue
+        key = ENQUEUED_KEY.format(input_hash(entrega_dir, skel_hash))
+        if force:
+            redis_conn.delete(key)
+        if dry_run:
+            duplicates += redis_conn.exists(key)
+        elif redis_conn.set(key, task.job_id, nx=True, ex=ENQUEUED_TTL):
+            low_priority_queue.enqueue(CORREGIR_ENTREGA, task, job_id=task.job_id)
+            job_ids.append(task.job_id)
+        else:
+            duplicates += 1
+
+    print(
+        f"{tp_id}/{cuatri}: {len(job_ids)} encoladas, {duplicates} ya encoladas"
+        f" con la misma entrada, {skipped} sin corrección anterior",
+        file=sys.stderr,
+    )
+    return job_ids
+
+
+def wait(job_ids: List[str]):
+    """Informa el avance de los trabajos hasta que terminan todos.
+    """
+    start = time.monotonic()
+    pending = list(job_ids)
+    failed = 0
+
+    while pending:
+        time.sleep(POLL_INTERVAL)
+        jobs = Job.fetch_many(pending, connection=redis_conn)
+        # Los trabajos que ya no existen (p.ej. expiraron) se cuentan como fallidos.
+        failed += sum(1 for job in jobs if job is None or job.is_failed)
+        pending = [
+            job.id for job in jobs if job and not job.is_finished and not job.is_failed
+        ]
+
+        done = len(job_ids) - len(pending)
+        rate = done / ((time.monotonic() - start) / 60)
+        eta = f", faltan ~{len(pending) / rate:.0f} min" if rate and pending else ""
+        print(
+            f"{done}/{len(job_ids)} terminadas ({failed} con error interno),"
+            f" {rate:.1f} por minuto{eta}",
+            file=sys.stderr,
+        )
+
+
+def _is_parcialito(relpath: pathlib.PurePosixPath) -> bool:
+    return relpath.parts[0] == "parcialitos"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("tp_id", help="identificador del TP, p.ej. hash")
+    parser.add_argument("--cuatri", help="cuatrimestre (por omisión, el actual)")
+    parser.add_argument("--dry-run", action="store_true", help="no encolar nada")
+    parser.add_argument("--force", action="store_true", help="no omitir ninguna")
+    parser.add_argument("--no-wait", action="store_true", help="no esperar el fin")
+    args = parser.parse_args()
+
+    job_ids = enqueue_all(
+        args.tp_id.lower(),
+        args.cuatri or settings.cuatri,
+        dry_run=args.dry_run,
+        force=args.force,
+    )
+    if job_ids and not args.no_wait:
+        wait(job_ids)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""Supervisor de workers de corrección, que los escala según la cola.
+
+Uso (desde entregas.ini, con attach-daemon):
+
+    python -m algorw.app.supervisor QUEUE [QUEUE ...]
+
+Cada SCALE_INTERVAL segundos se mira la cantidad de trabajos en las colas y la
+antigüedad del más viejo, y se ajusta la cantidad de procesos `rq worker` entre
+MIN_WORKERS y MAX_WORKERS, sin superar la cantidad de CPUs ni la memoria
+disponible (cada worker puede usar hasta CORRECTOR_WORKER_MAX_RSS MiB, ver
+corrector/worker.py).
+
+Si se usa el pool de workers de corrección (CORRECTOR_POOL_SIZE, ver
+corrector/worker.py), se usa rq.SimpleWorker, que ejecuta los trabajos en el
+mismo proceso en lugar de crear uno nuevo para cada uno, para que el pool se
+conserve entre trabajos.
+
+Para reducir la cantidad de workers se les envía SIGTERM, con lo que rq termina
+el trabajo en curso antes de salir ("warm shutdown"). Para no oscilar, solo se
+reduce tras SCALE_DOWN_AFTER intervalos seguidos con workers de más.
+"""
+
+import datetime
+import math
+import os
+import pathlib
+import signal
+import subprocess
+import sys
+import time
+
+from typing import List
+
+from dotenv import load_dotenv
+from redis import Redis
+from rq import Queue  # type: ignore
+from rq.job import Job  # type: ignore
+
+from ..common import metrics
+
+
+load_dotenv()
+
+MIN_WORKERS = int(os.environ.get("CORRECTOR_MIN_WORKERS", 1))
+# Los workers guardan las entregas en el mismo repositorio, pero cada uno arma
+# sus commits en un índice propio (ver corrector/committer.py).
+MAX_WORKERS = int(os.environ.get("CORRECTOR_MAX_WORKERS", 4))
+
+# Trabajos en cola por worker, y antigüedad máxima del trabajo más viejo
+# (segundos) a partir de la cual se agrega un worker más.
+JOBS_PER_WORKER = int(os.environ.get("CORRECTOR_JOBS_PER_WORKER", 5))
+MAX_JOB_AGE = int(os.environ.get("CORRECTOR_MAX_JOB_AGE", 120))
+
+# Memoria que se reserva por worker: el límite del proceso de corrección, más
+# el propio rq worker.
+WORKER_MEMORY = (int(os.environ.get("CORRECTOR_WORKER_MAX_RSS", 1024)) + 128) << 20
+
+# Ver corrector/worker.py.
+WORKER_POOL_SIZE = int(os.environ.get("CORRECTOR_POOL_SIZE", 0))
+
+SCALE_INTERVAL = 10
+SCALE_DOWN_AFTER = 6
+DRAIN_TIMEOUT = 600
+
+RQ_BIN = pathlib.Path(sys.executable).with_name("rq")
+
+redis_conn = Redis()
+
+
+class Supervisor:
+    """Conjunto de procesos `rq worker` que atienden las mismas colas.
+    """
+
+    def __init__(self, queue_names: List[str]):
+        self._queue_names = queue_names
+        self._queues = [Queue(name, connection=redis_conn) for name in queue_names]
+        self._workers: List[subprocess.Popen] = []
+        self._draining: List[subprocess.Popen] = []
+        self._excess_intervals = 0
+
+    def run(self):
+        """Ajusta la cantidad de workers periódicamente, hasta recibir SIGTERM.
+        """
+        stopping = False
+
+        def stop(signum, frame):
+            nonlocal stopping
+            stopping = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        while not stopping:
+            self._reap()
+            self.scale(self.desired_workers())
+            time.sleep(SCALE_INTERVAL)
+
+        self.shutdown()
+
+    def desired_workers(self) -> int:
+        """Calcula cuántos workers hacen falta según el estado de las colas.
+        """
+        depth = sum(len(queue) for queue in self._queues)
+        age = self._oldest_job_age()
+        metrics.gauge("queue_depth", depth)
+        metrics.gauge("oldest_job_age_seconds", age)
+
+        wanted = math.ceil(depth / JOBS_PER_WORKER)
+        if age > MAX_JOB_AGE:
+            wanted = max(wanted, len(self._workers) + 1)
+        return max(MIN_WORKERS, min(wanted, self._capacity()))
+
+    def scale(self, wanted: int):
+        current = len(self._workers)
+        if wanted > current:
+            self._excess_intervals = 0
+            for _ in range(wanted - current):
+                self._spawn()
+        elif wanted < current:
+            # Reducir solo si sobran workers durante un buen rato.
+            self._excess_intervals += 1
+            if self._excess_intervals >= SCALE_DOWN_AFTER:
+                self._excess_intervals = 0
+                self._drain(self._workers.pop())
+        else:
+            self._excess_intervals = 0
+        metrics.gauge("workers", len(self._workers))
+
+    def shutdown(self):
+        """Termina todos los workers, esperando a que terminen su trabajo.
+        """
+        while self._workers:
+            self._drain(self._workers.pop())
+        deadline = time.monotonic() + DRAIN_TIMEOUT
+        for proc in self._draining:
+            try:
+                proc.wait(timeout=max(0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        metrics.gauge("workers", 0)
+
+    def _capacity(self) -> int:
+        """Máximo de workers según la configuración, las CPUs y la memoria.
+        """
+        by_memory = len(self._workers) + available_memory() // WORKER_MEMORY
+        return max(MIN_WORKERS, min(MAX_WORKERS, os.cpu_count() or 1, by_memory))
+
+    def _oldest_job_age(self) -> float:
+        now = datetime.datetime.utcnow()
+        ages = [0.0]
+        for queue in self._queues:
+            for job_id in queue.get_job_ids(0, 1):
+                job = Job.fetch(job_id, connection=redis_conn)
+                if job.enqueued_at:
+                    ages.append((now - job.enqueued_at).total_seconds())
+        return max(ages)
+
+    def _spawn(self):
+        cmd = [str(RQ_BIN), "worker", *self._queue_names]
+        if WORKER_POOL_SIZE > 0:
+            cmd += ["--worker-class", "rq.SimpleWorker"]
+        self._workers.append(subprocess.Popen(cmd))
+        print(f"supervisor: iniciado worker ({len(self._workers)})", file=sys.stderr)
+
+    def _drain(self, proc: subprocess.Popen):
+        # rq termina el trabajo en curso al recibir SIGTERM (warm shutdown).
+        proc.send_signal(signal.SIGTERM)
+        self._draining.append(proc)
+        print(f"supervisor: deteniendo worker {proc.pid}", file=sys.stderr)
+
+    def _reap(self):
+        """Descarta los workers que terminaron (se reemplazan en scale()).
+        """
+        for proc in self._workers:
+            if proc.poll() is not None:
+                print(f"supervisor: el worker {proc.pid} terminó", file=sys.stderr)
+        self._workers = [proc for proc in self._workers if proc.poll() is None]
+        self._draining = [proc for proc in self._draining if proc.poll() is None]
+
+
+def available_memory() -> int:
+    """Devuelve la memoria disponible del sistema, en bytes (MemAvailable).
+    """
+    with open("/proc/meminfo") as meminfo:
+        for line in meminfo:
+            if line.startswith("MemAvailable:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(f"Uso: {sys.argv[0]} QUEUE [QUEUE ...]", file=sys.stderr)
+        return 2
+    Supervisor(sys.argv[1:]).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,16 +1,33 @@
+import datetime
 import os
 import signal
 import sys
+import time
 
+from rq import get_current_job  # type: ignore
+
+from ..common import traces
 from ..common.tasks import CorrectorTask
 from ..corrector import corregir_entrega as corrector_original
 
 
 def corregir_entrega(task: CorrectorTask):
     reload_fetchmail()
+    record_queue_wait(task)
     corrector_original(task)
 
 
+def record_queue_wait(task: CorrectorTask):
+    """Registra en la traza de la entrega el tiempo que esperó en la cola.
+    """
+    job = get_current_job()
+    if task.trace_id and job is not None and job.enqueued_at is not None:
+        # rq guarda las fechas en UTC, sin zona horaria.
+        utc = job.enqueued_at.replace(tzinfo=datetime.timezone.utc)
+        enqueued = utc.timestamp()
+        traces.record(task.trace_id, "queue_wait", enqueued, time.time() - enqueued)
+
+
 def reload_fetchmail():
     try:
         with open(os.path.expanduser("~/.fetchmail.pid")) as pidfile:
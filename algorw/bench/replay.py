@@ -0,0 +1,239 @@
+"""Benchmark del corrector que reprocesa entregas históricas.
+
+Uso:
+
+    python -m algorw.bench.replay [--tp pila] [--cuatri 2020_1] [--limit 50]
+                                  [--jobs 4] [--output resultados.json]
+                                  [--compare anteriores.json]
+
+Se arma un CorrectorTask por cada entrega archivada en DATA_DIR (a partir de
+sus archivos, sin README.md ni la salida del worker), y se los procesa con
+procesar_entrega() en `--jobs` procesos, como lo haría rq. Para no depender de
+nada externo:
+
+  - el worker es un script que descarta su entrada, espera `--worker-delay`
+    segundos, e imprime "Todo OK";
+
+  - las entregas se guardan en un repositorio temporal, con otro repositorio
+    temporal como origin (el push se mide tras cada corrección);
+
+  - el envío de la respuesta por mail solo espera `--smtp-delay` segundos.
+
+Se informa el tiempo de cada etapa (ver algorw.common.timing), las entregas por
+minuto y la memoria máxima; con --output se guardan en JSON, junto con el commit
+actual, para compararlos con los de otra versión (--compare).
+"""
+
+import argparse
+import json
+import multiprocessing
+import pathlib
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from email.utils import formatdate
+from typing import Dict, List, Tuple
+
+from ..common import timing
+from ..common.tasks import CorrectorTask
+from ..corrector import corrector, pusher, shards
+from ..corrector.export import zip_entrega
+
+
+STUB_WORKER = """#!/bin/sh
+cat > /dev/null
+sleep {delay}
+echo "Todo OK"
+"""
+
+STAGES = ["zip_walk", "tar", "worker", "moss_commit", "push", "reply"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--tp", help="solo entregas de este TP")
+    parser.add_argument("--cuatri", help="solo entregas de este cuatrimestre")
+    parser.add_argument("--limit", type=int, default=50, help="cantidad de entregas")
+    parser.add_argument("--jobs", type=int, default=1, help="correcciones en paralelo")
+    parser.add_argument("--worker-delay", type=float, default=0.0)
+    parser.add_argument("--smtp-delay", type=float, default=0.0)
+    parser.add_argument("--output", type=pathlib.Path, help="guardar resultados")
+    parser.add_argument("--compare", type=pathlib.Path, help="resultados anteriores")
+    args = parser.parse_args()
+
+    tasks = load_tasks(corrector.DATA_DIR, args.tp, args.cuatri, args.limit)
+    if not tasks:
+        print("no se encontraron entregas", file=sys.stderr)
+        return 1
+
+    with tempfile.TemporaryDirectory(prefix="replay") as tmp:
+        sandbox = pathlib.Path(tmp)
+        setup_sandbox(sandbox, args.worker_delay, args.smtp_delay)
+        wall_start = time.perf_counter()
+        mp_context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(args.jobs, mp_context=mp_context) as pool:
+            results = list(pool.map(run_task, tasks))
+        wall = time.perf_counter() - wall_start
+
+    report = summarize(results, wall, vars(args))
+    print_report(report)
+
+    if args.compare:
+        print_comparison(json.loads(args.compare.read_text()), report)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, default=str) + "\n")
+
+    return 1 if report["failures"] else 0
+
+
+def load_tasks(
+    data_dir: pathlib.Path, tp: str = None, cuatri: str = None, limit: int = 50
+) -> List[CorrectorTask]:
+    """Arma tareas de corrección a partir de las entregas archivadas.
+    """
+    pattern = f"{tp or '*'}/{cuatri or '*'}/*"
+    tasks = []
+    for entrega_dir in sorted(data_dir.glob(pattern)):
+        relpath = entrega_dir.relative_to(data_dir)
+        if not entrega_dir.is_dir() or relpath.parts[0] in {".git", "parcialitos"}:
+            continue
+        tp_id = relpath.parts[0]
+        tasks.append(
+            CorrectorTask(
+                tp_id=tp_id,
+                legajos=entrega_dir.name.split("_"),
+                zipfile=zip_entrega(entrega_dir),
+                orig_headers={
+                    "Subject": f"Entrega {tp_id}: {entrega_dir.name}",
+                    "Date": formatdate(),
+                    "Message-ID": f"<replay.{len(tasks)}@localhost>",
+                },
+                repo_relpath=relpath,
+            )
+        )
+        if len(tasks) >= limit:
+            break
+    return tasks
+
+
+def setup_sandbox(sandbox: pathlib.Path, worker_delay: float, smtp_delay: float):
+    """Reemplaza el worker, el repositorio de entregas y el envío de mail.
+    """
+    origin = sandbox / "origin.git"
+    entregas = sandbox / "entregas"
+    subprocess.run(["git", "init", "-q", "--bare", origin], check=True)
+    subprocess.run(["git", "init", "-q", entregas], check=True)
+    for key, value in [("user.name", "replay"), ("user.email", "replay@localhost")]:
+        subprocess.run(["git", "config", key, value], cwd=entregas, check=True)
+    subprocess.run(["git", "remote", "add", "origin", origin], cwd=entregas, check=True)
+    subprocess.run(
+        ["git", "commit", "-q", "--allow-empty", "-m", "replay"],
+        cwd=entregas,
+        check=True,
+    )
+    # Con la rama ya en origin, pusher.push() la actualiza (push de ramas en común).
+    subprocess.run(["git", "push", "-q", "origin", "HEAD"], cwd=entregas, check=True)
+
+    worker = sandbox / "worker"
+    worker.write_text(STUB_WORKER.format(delay=worker_delay))
+    worker.chmod(0o755)
+
+    def sendmail(message, creds):
+        time.sleep(smtp_delay)
+
+    corrector.DATA_DIR = entregas
+    shards.DATA_DIR = entregas
+    shards.SHARDING = ""
+    corrector.WORKER_BIN = worker
+    corrector.cfg.test = False
+    corrector.utils.get_oauth_credentials = lambda cfg: None
+    corrector.utils.sendmail = sendmail
+    pusher.request_push = lambda repo_dir, **kwargs: None
+    corrector.notas.record = lambda tp_id, legajos, ok: None
+
+
+def run_task(task: CorrectorTask) -> Tuple[Dict[str, float], str]:
+    """Procesa una tarea, y devuelve el tiempo de cada etapa y el error, si hubo.
+    """
+    error = ""
+    with timing.collect() as stages:
+        try:
+            corrector.procesar_entrega(task)
+        except Exception as ex:
+            error = f"{type(ex).__name__}: {ex}"
+        with timing.span("push"):
+            pusher.push(str(corrector.DATA_DIR))
+    return dict(stages), error
+
+
+def summarize(results: List[Tuple[Dict[str, float], str]], wall: float, params):
+    stages = {}
+    for stage in STAGES:
+        values = sorted(s[stage] for s, _ in results if stage in s)
+        if values:
+            stages[stage] = {
+                "mean": statistics.mean(values),
+                "p50": statistics.median(values),
+                "p95": values[int(0.95 * (len(values) - 1))],
+                "total": sum(values),
+            }
+    return {
+        "commit": git_head(),
+        "time": time.time(),
+        "params": {k: v for k, v in params.items() if k not in {"output", "compare"}},
+        "jobs": len(results),
+        "failures": len([e for _, e in results if e]),
+        "errors": sorted({e for _, e in results if e}),
+        "wall_seconds": wall,
+        "jobs_per_minute": 60 * len(results) / wall,
+        "stages": stages,
+        "peak_rss_mib": {
+            "harness": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+        },
+    }
+
+
+def print_report(report):
+    print(f"commit {report['commit']}")
+    print(
+        f"{report['jobs']} entregas ({report['failures']} con error) en "
+        f"{report['wall_seconds']:.1f} s: {report['jobs_per_minute']:.1f} por minuto"
+    )
+    print(f"{'etapa':<12} {'media':>9} {'p50':>9} {'p95':>9}")
+    for stage, stats in report["stages"].items():
+        cols = " ".join(f"{stats[k] * 1000:7.1f}ms" for k in ("mean", "p50", "p95"))
+        print(f"{stage:<12} {cols}")
+    rss = report["peak_rss_mib"]
+    print(f"memoria máxima: {rss['harness']:.0f} MiB, hijos {rss['children']:.0f} MiB")
+    for error in report["errors"]:
+        print(f"error: {error}", file=sys.stderr)
+
+
+def print_comparison(before, after):
+    print(f"\ncomparación con {before['commit']}:")
+    rate = after["jobs_per_minute"] / before["jobs_per_minute"] - 1
+    print(f"{'por minuto':<12} {rate:+8.1%}")
+    for stage, stats in after["stages"].items():
+        if (old := before["stages"].get(stage)) and old["p50"]:
+            print(f"{stage:<12} {stats['p50'] / old['p50'] - 1:+8.1%} (p50)")
+
+
+def git_head() -> str:
+    repo_dir = pathlib.Path(__file__).parent
+    result = subprocess.run(
+        ["git", "describe", "--always", "--dirty"],
+        cwd=repo_dir,
+        capture_output=True,
+        encoding="utf-8",
+    )
+    return result.stdout.strip() or "desconocido"
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Tiempo de importación de la app web y del corrector, con un presupuesto.
+
+Uso:
+
+    python -m algorw.bench.startup [--runs 5] [--wsgi 0.8] [--corrector 0.5]
+
+Cada módulo se importa en un intérprete nuevo (como le sucede a un worker de
+uWSGI con lazy-apps, o al work-horse de rq), y se toma la mediana de `--runs`
+ejecuciones. Si algún tiempo supera su presupuesto (en segundos), se listan
+los módulos que más tardaron en importarse y se termina con error, para poder
+usarlo en `make bench-startup` antes de un deploy.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+from typing import List, Tuple
+
+
+# Módulo a importar, y presupuesto por omisión en segundos.
+TARGETS = {
+    "wsgi": 0.8,
+    "corrector": 0.5,
+}
+
+MODULES = {
+    "wsgi": "wsgi",
+    "corrector": "algorw.app.tasks",  # Lo que importa rq para cada trabajo.
+}
+
+MEASURE = """
+import time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+"""
+
+
+def import_time(module: str) -> float:
+    """Tiempo de importación de un módulo en un intérprete nuevo, en segundos.
+    """
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE.format(module=module)],
+        check=True,
+        capture_output=True,
+        encoding="utf-8",
+    )
+    return float(result.stdout.split()[-1])
+
+
+def slowest_imports(module: str, count: int = 10) -> List[Tuple[int, str]]:
+    """Devuelve los módulos de mayor tiempo de importación propio (en µs).
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        encoding="utf-8",
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            own, _, name = line.split(":", 1)[1].split("|")
+            if own.strip().isdigit():
+                times.append((int(own), name.strip()))
+    return sorted(times, reverse=True)[:count]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("--runs", type=int, default=5)
+    for target, budget in TARGETS.items():
+        parser.add_argument(f"--{target}", type=float, default=budget, metavar="SEG")
+    args = parser.parse_args()
+
+    over_budget = False
+    for target, module in MODULES.items():
+        budget = getattr(args, target)
+        elapsed = statistics.median(import_time(module) for _ in range(args.runs))
+        status = "ok" if elapsed <= budget else "EXCEDIDO"
+        limit = f"presupuesto {budget * 1000:.0f} ms"
+        print(f"{target:<10} {elapsed * 1000:7.0f} ms ({limit}) {status}")
+        if elapsed > budget:
+            over_budget = True
+            for own, name in slowest_imports(module):
+                print(f"    {own / 1000:7.1f} ms  {name}")
+
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
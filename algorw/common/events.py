@@ -0,0 +1,97 @@
+"""Eventos de progreso de una corrección, guardados en Redis.
+
+El corrector publica, para cada trabajo, las líneas de salida del worker a
+medida que se producen (evento "line") y, al final, el resultado (evento
+"done"). La página de resultado los consulta periódicamente (ver
+main.job_status).
+
+Cada evento lleva un número de secuencia, y se guarda en una lista con
+vencimiento (HISTORY_TTL). Así, cada consulta pide solo los eventos posteriores
+al último que recibió, sin duplicados.
+"""
+
+import json
+
+from typing import List, NamedTuple, Optional
+
+from redis import Redis
+
+
+__all__ = [
+    "Event",
+    "OutputPublisher",
+    "history",
+    "publish",
+]
+
+HISTORY_TTL = 3600
+DONE = "done"
+
+redis_conn = Redis()
+
+
+class Event(NamedTuple):
+    seq: int
+    event: str
+    data: str
+
+
+def publish(job_id: str, event: str, data: str):
+    """Publica un evento para un trabajo.
+    """
+    seq = redis_conn.incr(_key(job_id, "seq"))
+    message = json.dumps({"seq": seq, "event": event, "data": data})
+    with redis_conn.pipeline() as pipe:
+        pipe.expire(_key(job_id, "seq"), HISTORY_TTL)
+        pipe.rpush(_key(job_id, "history"), message)
+        pipe.expire(_key(job_id, "history"), HISTORY_TTL)
+        pipe.execute()
+
+
+def history(job_id: str, *, after: int = 0) -> List[Event]:
+    """Devuelve los eventos de un trabajo, sin esperar a que haya nuevos.
+
+    Args:
+      job_id: el identificador del trabajo.
+      after: omitir los eventos con número de secuencia menor o igual.
+    """
+    # El evento con número de secuencia N está en la posición N - 1.
+    messages = redis_conn.lrange(_key(job_id, "history"), after, -1)
+    return [event for m in messages if (event := _parse(m, after)) is not None]
+
+
+class OutputPublisher:
+    """Publica línea por línea la salida de un worker (ver WorkerProcess).
+
+    Se publican a lo sumo `limit` bytes; la salida completa queda en Moss.
+    """
+
+    def __init__(self, job_id: str, limit: int = 64 * 1024):
+        self._job_id = job_id
+        self._pending = b""
+        self._remaining = limit
+
+    def write(self, data: bytes):
+        if self._remaining <= 0:
+            return
+        data = data[: self._remaining]
+        self._remaining -= len(data)
+        *lines, self._pending = (self._pending + data).split(b"\n")
+        for line in lines:
+            publish(self._job_id, "line", line.decode("utf-8", errors="replace"))
+        if self._remaining <= 0:
+            publish(self._job_id, "line", "[…]")
+
+    def close(self):
+        if self._pending:
+            line, self._pending = self._pending, b""
+            publish(self._job_id, "line", line.decode("utf-8", errors="replace"))
+
+
+def _parse(message: bytes, after: int) -> Optional[Event]:
+    event = Event(**json.loads(message))
+    return event if event.seq > after else None
+
+
+def _key(job_id: str, suffix: str) -> str:
+    return f"entregas:job:{job_id}:{suffix}"
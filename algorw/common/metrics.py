@@ -0,0 +1,79 @@
+"""Métricas simples del sistema de entregas, guardadas en Redis.
+
+Cada métrica es un valor numérico con nombre (p. ej. "push_lag_seconds"),
+que se guarda en el hash METRICS_KEY junto con la hora de su última
+actualización. Así, cualquier proceso (app web, workers, daemons) puede
+publicarlas, y se pueden consultar con `python -m algorw.common.metrics`.
+
+Además, sample() guarda las últimas SAMPLE_SIZE mediciones de una serie (p. ej.
+la duración de cada corrección de un TP), y mean() devuelve su promedio.
+"""
+
+import time
+
+from typing import Dict, Optional
+
+from redis import Redis
+
+
+__all__ = [
+    "gauge",
+    "incr",
+    "mean",
+    "sample",
+    "snapshot",
+]
+
+METRICS_KEY = "entregas:metrics"
+SAMPLES_KEY = "entregas:samples:{}"
+SAMPLE_SIZE = 50
+
+redis_conn = Redis()
+
+
+def gauge(name: str, value: float):
+    """Establece el valor actual de una métrica.
+    """
+    redis_conn.hset(METRICS_KEY, mapping={name: value, f"{name}:updated": time.time()})
+
+
+def incr(name: str, amount: float = 1):
+    """Incrementa un contador.
+    """
+    with redis_conn.pipeline() as pipe:
+        pipe.hincrbyfloat(METRICS_KEY, name, amount)
+        pipe.hset(METRICS_KEY, f"{name}:updated", time.time())
+        pipe.execute()
+
+
+def sample(name: str, value: float):
+    """Agrega una medición a una serie, descartando las más antiguas.
+    """
+    key = SAMPLES_KEY.format(name)
+    with redis_conn.pipeline() as pipe:
+        pipe.lpush(key, value)
+        pipe.ltrim(key, 0, SAMPLE_SIZE - 1)
+        pipe.execute()
+
+
+def mean(name: str) -> Optional[float]:
+    """Devuelve el promedio de las mediciones de una serie, o None si no hay.
+    """
+    values = [float(v) for v in redis_conn.lrange(SAMPLES_KEY.format(name), 0, -1)]
+    return sum(values) / len(values) if values else None
+
+
+def snapshot() -> Dict[str, float]:
+    """Devuelve todas las métricas (sin las horas de actualización).
+    """
+    values = redis_conn.hgetall(METRICS_KEY)
+    return {
+        k.decode("utf-8"): float(v)
+        for k, v in values.items()
+        if not k.endswith(b":updated")
+    }
+
+
+if __name__ == "__main__":
+    for name, value in sorted(snapshot().items()):
+        print(f"{name} {value:g}")
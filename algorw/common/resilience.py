@@ -0,0 +1,220 @@
+"""Timeouts, reintentos y "circuit breakers" para los servicios externos.
+
+Cuando un servicio externo (Google, SMTP, Github) se degrada, sin límites los
+hilos de uWSGI y los workers quedan bloqueados esperándolo. Para cada servicio
+hay un CircuitBreaker (ver breaker()) que:
+
+  - reintenta las llamadas fallidas, con backoff exponencial y jitter, hasta
+    `retries` veces;
+
+  - tras `failure_threshold` fallas seguidas, "abre el circuito": durante
+    `reset_timeout` segundos, las llamadas fallan de inmediato con
+    CircuitOpenError, sin contactar al servicio;
+
+  - pasado ese tiempo, deja pasar una única llamada de prueba ("half-open"):
+    si funciona, cierra el circuito; si no, lo vuelve a abrir.
+
+Los timeouts de cada servicio están en TIMEOUTS, para pasárselos a cada
+cliente. El estado de cada circuito se publica en las métricas como
+"circuit_open:<servicio>" (1 si está abierto), junto con la cantidad de fallas
+("circuit_failures:<servicio>").
+
+Las URLs de los servicios se pueden configurar (ver Settings), de modo que se
+los puede reemplazar por servidores locales que simulen fallas.
+"""
+
+import random
+import threading
+import time
+
+from typing import Callable, Dict, Tuple, Type, TypeVar
+
+from redis import RedisError
+
+from . import metrics
+
+
+__all__ = [
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "TIMEOUTS",
+    "breaker",
+]
+
+T = TypeVar("T")
+
+# Timeout (en segundos) de cada servicio.
+TIMEOUTS = {
+    "recaptcha": 5.0,
+    "google_oauth": 10.0,
+    "sheets": 30.0,
+    "smtp": 30.0,
+    "github": 15.0,
+}
+
+# Parámetros de cada servicio: (reintentos, fallas para abrir, segundos abierto).
+# SMTP no se reintenta, para no enviar dos veces un mismo mensaje; reCAPTCHA
+# tampoco, porque cada respuesta del captcha se puede verificar una sola vez.
+POLICIES: Dict[str, Tuple[int, int, float]] = {
+    "recaptcha": (0, 5, 30.0),
+    "google_oauth": (2, 5, 60.0),
+    "sheets": (2, 3, 120.0),
+    "sheets_write": (2, 3, 120.0),
+    "smtp": (0, 5, 60.0),
+    "github": (2, 5, 60.0),
+}
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 5.0
+
+_breakers: Dict[str, "CircuitBreaker"] = {}
+_breakers_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    """El circuito de un servicio está abierto: se falla sin contactarlo.
+    """
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} no disponible (reintentar en {retry_after:.0f} s)")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Circuit breaker con reintentos para un servicio externo.
+
+    Uso:
+
+        resultado = breaker("sheets").call(query.execute)
+
+    Solo cuentan como fallas las excepciones de tipo `failures` para las que
+    `is_failure` devuelve True; el resto (p.ej. un 404) se propaga sin más.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        retries: int = 2,
+        failure_threshold: int = 5,
+        reset_timeout: float = 60.0,
+        failures: Tuple[Type[BaseException], ...] = (Exception,),
+        is_failure: Callable[[BaseException], bool] = lambda ex: True,
+    ):
+        self.name = name
+        self._retries = retries
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = failures
+        self._is_failure = is_failure
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def call(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Llama a func, con reintentos, salvo que el circuito esté abierto.
+
+        Raises:
+          CircuitOpenError si el circuito está abierto; si no, la última
+          excepción de func.
+        """
+        return self._call(self._retries, func, args, kwargs)
+
+    def call_once(self, func: Callable[..., T], *args, **kwargs) -> T:
+        """Como call(), pero sin reintentos (p.ej. para operaciones no idempotentes).
+        """
+        return self._call(0, func, args, kwargs)
+
+    def _call(self, retries: int, func: Callable[..., T], args, kwargs) -> T:
+        for attempt in range(retries + 1):
+            trial = self._before_call()
+            try:
+                result = func(*args, **kwargs)
+            except self._failures as ex:
+                if not self._is_failure(ex):
+                    self._end_trial(trial)
+                    raise
+                self._record_failure(trial)
+                if attempt == retries or self.is_open:
+                    raise
+                time.sleep(backoff(attempt))
+            except BaseException:
+                self._end_trial(trial)
+                raise
+            else:
+                self._record_success(trial)
+                return result
+        raise AssertionError("unreachable")
+
+    def _before_call(self) -> bool:
+        """Verifica el estado del circuito; devuelve True si es la llamada de prueba.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            remaining = self._opened_at + self._reset_timeout - time.monotonic()
+            if remaining > 0 or self._trial_running:
+                raise CircuitOpenError(self.name, max(remaining, 0))
+            self._trial_running = True
+            return True
+
+    def _end_trial(self, trial: bool):
+        if trial:
+            with self._lock:
+                self._trial_running = False
+
+    def _record_success(self, trial: bool):
+        with self._lock:
+            was_open = self._opened_at is not None
+            self._consecutive = 0
+            self._opened_at = None
+            self._trial_running = False
+        if was_open:
+            self._publish(opened=False)
+
+    def _record_failure(self, trial: bool):
+        with self._lock:
+            self._consecutive += 1
+            self._trial_running = False
+            opened = trial or self._consecutive >= self._failure_threshold
+            if opened:
+                self._opened_at = time.monotonic()
+        self._publish(opened=opened, failed=True)
+
+    def _publish(self, *, opened: bool, failed: bool = False):
+        # Que falle Redis no debe ocultar el error original.
+        try:
+            if failed:
+                metrics.incr(f"circuit_failures:{self.name}")
+            if opened or not failed:
+                metrics.gauge(f"circuit_open:{self.name}", int(opened))
+        except RedisError:
+            pass
+
+
+def breaker(name: str, **kwargs) -> CircuitBreaker:
+    """Devuelve el circuit breaker (compartido por el proceso) de un servicio.
+
+    Los argumentos se pasan a CircuitBreaker la primera vez; por omisión, se
+    usan los de POLICIES.
+    """
+    with _breakers_lock:
+        if (cb := _breakers.get(name)) is None:
+            retries, threshold, reset = POLICIES.get(name, (2, 5, 60.0))
+            kwargs.setdefault("retries", retries)
+            kwargs.setdefault("failure_threshold", threshold)
+            kwargs.setdefault("reset_timeout", reset)
+            cb = _breakers[name] = CircuitBreaker(name, **kwargs)
+        return cb
+
+
+def backoff(attempt: int) -> float:
+    """Espera antes del reintento `attempt` (0, 1, ...), con "full jitter".
+    """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
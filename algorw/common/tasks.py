@@ -22,6 +22,18 @@ class CorrectorTask(BaseModel):
     orig_headers: Dict[str, str]
     group_id: Optional[str] = None
 
+    # Identificador del trabajo en la cola, con el que el corrector publica su
+    # progreso (ver algorw.common.events).
+    job_id: Optional[str] = None
+
+    # Identificador de la traza de la entrega, con la que se mide la duración
+    # de cada etapa (ver algorw.common.traces).
+    trace_id: Optional[str] = None
+
+    # En las re-correcciones (ver algorw.app.recorregir), el resultado anterior
+    # ("Todo OK" o no): solo se envía respuesta si el nuevo resultado es otro.
+    previous_ok: Optional[bool] = None
+
     # Ubicación de la entrega en el repo de entregas. A día de hoy el sistema
     # de entregas elige la ruta, y el corrector guarda los archivos. Próximamente,
     # el sistema de entregas guardará los archivos, y el corrector los leerá.
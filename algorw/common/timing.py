@@ -0,0 +1,86 @@
+"""Medición del tiempo de cada etapa de una corrección.
+
+El corrector marca sus etapas con span():
+
+    with timing.span("worker"):
+        ...
+
+Si nadie está recolectando (lo normal en producción), span() solo toma el
+tiempo. Dentro de un bloque collect(), los tiempos de las etapas del hilo
+actual se acumulan en el diccionario que devuelve collect():
+
+    with timing.collect() as stages:
+        procesar_entrega(task)
+    print(stages)  # {"zip_walk": 0.01, "tar": 0.2, "worker": 3.1, ...}
+
+Además, dentro de un bloque trace(), cada etapa se registra en la traza de la
+entrega (ver algorw.common.traces):
+
+    with timing.trace(task.trace_id):
+        procesar_entrega(task)
+"""
+
+import contextlib
+import threading
+import time
+
+from collections import defaultdict
+from typing import DefaultDict, Iterator, Optional
+
+from . import traces
+
+
+__all__ = [
+    "collect",
+    "current_trace",
+    "span",
+    "trace",
+]
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def span(name: str) -> Iterator[None]:
+    """Mide el tiempo de una etapa.
+    """
+    wall_start = time.time()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        if (stages := getattr(_local, "stages", None)) is not None:
+            stages[name] += elapsed
+        if (trace_id := current_trace()) is not None:
+            traces.record(trace_id, name, wall_start, elapsed)
+
+
+@contextlib.contextmanager
+def collect() -> Iterator[DefaultDict[str, float]]:
+    """Recolecta los tiempos de las etapas del hilo actual.
+    """
+    previous = getattr(_local, "stages", None)
+    stages = _local.stages = defaultdict(float)
+    try:
+        yield stages
+    finally:
+        _local.stages = previous
+
+
+@contextlib.contextmanager
+def trace(trace_id: Optional[str]) -> Iterator[None]:
+    """Registra las etapas del hilo actual en una traza (si trace_id no es None).
+    """
+    previous = current_trace()
+    _local.trace_id = trace_id
+    try:
+        yield
+    finally:
+        _local.trace_id = previous
+
+
+def current_trace() -> Optional[str]:
+    """Devuelve el identificador de la traza activa en el hilo actual, o None.
+    """
+    return getattr(_local, "trace_id", None)
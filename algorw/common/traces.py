@@ -0,0 +1,207 @@
+"""Traza de cada entrega, desde que se sube hasta que se envía la respuesta.
+
+Cada entrega tiene un identificador de traza (CorrectorTask.trace_id), que se
+genera en main.post(). Cada etapa, en cualquier proceso (app web, worker,
+daemon de push), registra con record() su hora de inicio y su duración:
+
+    captcha, planilla, enqueue     (main.post)
+    queue_wait                     (según rq; ver algorw.app.tasks)
+    zip_walk, tar, worker,         (corrector; ver timing.span y timing.trace)
+    moss_commit, reply
+    push                           (desde el commit hasta el push, en pusher.py)
+
+Cada traza es un hash de Redis, "entregas:trace:<id>", con los campos
+"<etapa>" (duración acumulada) y "<etapa>:start" (hora del primer inicio),
+más los legajos de la entrega. El sorted set TRACES_KEY indexa las trazas por
+hora de inicio. Todo expira a los TRACE_TTL segundos.
+
+Para consultarlas:
+
+    python -m algorw.common.traces report [--since 24h]   # percentiles por etapa
+    python -m algorw.common.traces show LEGAJO [--since 7d]
+"""
+
+import argparse
+import math
+import re
+import sys
+import time
+
+from typing import Dict, Iterable, List
+
+from redis import Redis, RedisError
+
+
+__all__ = [
+    "record",
+    "set_legajos",
+]
+
+TRACE_KEY = "entregas:trace:{}"
+TRACES_KEY = "entregas:traces"
+TRACE_TTL = 7 * 24 * 3600
+
+LEGAJOS_FIELD = "legajos"
+
+# Orden en que se muestran las etapas.
+STAGES = [
+    "captcha",
+    "planilla",
+    "enqueue",
+    "queue_wait",
+    "zip_walk",
+    "tar",
+    "worker",
+    "moss_commit",
+    "push",
+    "reply",
+]
+
+PERCENTILES = [50, 90, 99]
+
+redis_conn = Redis()
+
+
+def record(trace_id: str, stage: str, start: float, duration: float):
+    """Registra una etapa de una traza.
+
+    Args:
+      start: hora de inicio (time.time()).
+      duration: duración en segundos; si la etapa se registra varias veces en
+          la misma traza (p.ej. "reply"), se suman.
+    """
+    key = TRACE_KEY.format(trace_id)
+    try:
+        with redis_conn.pipeline() as pipe:
+            pipe.hincrbyfloat(key, stage, duration)
+            pipe.hsetnx(key, f"{stage}:start", start)
+            pipe.expire(key, TRACE_TTL)
+            pipe.zadd(TRACES_KEY, {trace_id: start}, nx=True)
+            pipe.zremrangebyscore(TRACES_KEY, 0, time.time() - TRACE_TTL)
+            pipe.execute()
+    except RedisError as ex:
+        # La traza es informativa: no debe interrumpir la entrega.
+        print(f"traces: no se pudo registrar {stage}: {ex}", file=sys.stderr)
+
+
+def set_legajos(trace_id: str, legajos: Iterable[str]):
+    """Asocia los legajos de la entrega a la traza (para `show LEGAJO`).
+    """
+    key = TRACE_KEY.format(trace_id)
+    try:
+        redis_conn.hset(key, LEGAJOS_FIELD, " ".join(legajos))
+    except RedisError as ex:
+        print(f"traces: no se pudo registrar legajos: {ex}", file=sys.stderr)
+
+
+def fetch(since: float) -> List[Dict[str, str]]:
+    """Devuelve las trazas iniciadas a partir de `since` (time.time()).
+    """
+    trace_ids = redis_conn.zrangebyscore(TRACES_KEY, since, "+inf")
+    with redis_conn.pipeline() as pipe:
+        for trace_id in trace_ids:
+            pipe.hgetall(TRACE_KEY.format(trace_id.decode("ascii")))
+        results = pipe.execute()
+    traces = []
+    for trace_id, fields in zip(trace_ids, results):
+        if fields:
+            trace = {k.decode("utf-8"): v.decode("utf-8") for k, v in fields.items()}
+            trace["id"] = trace_id.decode("ascii")
+            traces.append(trace)
+    return traces
+
+
+def durations(trace: Dict[str, str]) -> Dict[str, float]:
+    """Devuelve la duración de cada etapa de una traza, y el total.
+
+    El total va desde el inicio de la primera etapa hasta el fin de la última,
+    y solo se calcula si se envió la respuesta (las entregas rechazadas en
+    main.post también tienen traza, pero solo con sus primeras etapas).
+    """
+    stages = {
+        name: float(value)
+        for name, value in trace.items()
+        if name not in {"id", LEGAJOS_FIELD} and not name.endswith(":start")
+    }
+    spans = [
+        (float(trace[f"{name}:start"]), float(trace[f"{name}:start"]) + value)
+        for name, value in stages.items()
+        if f"{name}:start" in trace
+    ]
+    if spans and "reply" in stages:
+        stages["total"] = max(end for _, end in spans) - min(s for s, _ in spans)
+    return stages
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil por el método "nearest rank", de una lista ordenada.
+    """
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+
+def parse_duration(text: str) -> float:
+    """Convierte "30m", "24h" o "7d" a segundos.
+    """
+    if not (match := re.fullmatch(r"(\d+(?:\.\d+)?)([smhd])", text)):
+        raise argparse.ArgumentTypeError(f"duración inválida: {text!r}")
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    return float(match[1]) * units[match[2]]
+
+
+def report(traces: List[Dict[str, str]]):
+    by_stage: Dict[str, List[float]] = {}
+    for trace in traces:
+        for stage, value in durations(trace).items():
+            by_stage.setdefault(stage, []).append(value)
+
+    order = [s for s in STAGES if s in by_stage]
+    order += sorted(set(by_stage) - set(STAGES) - {"total"})
+    order += ["total"] if "total" in by_stage else []
+
+    headers = [f"p{p}" for p in PERCENTILES] + ["max"]
+    print(f"{'etapa':<12} {'n':>6} " + " ".join(f"{h:>9}" for h in headers))
+    for stage in order:
+        values = sorted(by_stage[stage])
+        cols = [percentile(values, p) for p in PERCENTILES] + [values[-1]]
+        print(f"{stage:<12} {len(values):6d} " + " ".join(f"{v:9.3f}" for v in cols))
+
+
+def show(traces: List[Dict[str, str]], legajo: str):
+    found = [t for t in traces if legajo in t.get(LEGAJOS_FIELD, "").split()]
+    for trace in found:
+        stages = durations(trace)
+        start = min(float(v) for k, v in trace.items() if k.endswith(":start"))
+        when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start))
+        print(f"{trace['id']}  {when}  {trace.get(LEGAJOS_FIELD, '')}")
+        for stage in [s for s in STAGES if s in stages] + ["total"]:
+            if stage in stages:
+                print(f"  {stage:<12} {stages[stage]:9.3f} s")
+    if not found:
+        print(f"No hay trazas para {legajo}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    report_parser = subparsers.add_parser("report", help="percentiles por etapa")
+    report_parser.add_argument("--since", type=parse_duration, default="24h")
+    show_parser = subparsers.add_parser("show", help="trazas de un legajo")
+    show_parser.add_argument("legajo")
+    show_parser.add_argument("--since", type=parse_duration, default="7d")
+    args = parser.parse_args()
+
+    traces = fetch(time.time() - args.since)
+    if args.command == "show":
+        return show(traces, args.legajo)
+    if not traces:
+        print("No hay trazas en el período", file=sys.stderr)
+        return 1
+    report(traces)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
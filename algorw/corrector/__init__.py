@@ -1 +1,8 @@
-from .corrector import corregir_entrega
+def __getattr__(name):
+    # Se importa bajo demanda, para que los demás módulos del paquete (p.ej. el
+    # daemon de pusher.py) no carguen el corrector completo.
+    if name == "corregir_entrega":
+        from .corrector import corregir_entrega
+
+        return corregir_entrega
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -8,27 +8,42 @@ import os
 import pathlib
 import random
 import re
+import subprocess
+import sys
 import tempfile
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Dict, List, Set, Type, TypeVar
+from typing import Dict, List, Optional, Set, Tuple, Type, TypeVar
 
 import git  # type: ignore
 import github
 
 from git.objects.fun import traverse_tree_recursive  # type: ignore
+from git.objects.util import altz_to_utctz_str  # type: ignore
 from git.util import stream_copy  # type: ignore
 from github import InputGitTreeElement
 from github.GitTree import GitTree as GithubTree
 from github.Repository import Repository as GithubRepo
 
+from . import gh_client
+from .commit_index import CommitIndex
+
 
 T = TypeVar("T", bound="AluRepo")
 
 ROOT_DIR = pathlib.Path(os.environ["CORRECTOR_ROOT"])
 PLANILLA_TSV = ROOT_DIR / "conf" / "repos.tsv"
+MIRRORS_DIR = ROOT_DIR / "mirrors"
+
+# Modo de sincronización de AluRepo.sync: "mirror" o "rest".
+SYNC_MODE = os.environ.get("CORRECTOR_SYNC_MODE", "mirror")
+NULL_SHA = "0" * 40
+
+# Cantidad máxima de blobs que se suben en paralelo a Github.
+BLOB_UPLOAD_THREADS = 4
 
-GITHUB_TOKEN = os.environ["CORRECTOR_GH_TOKEN"]
 DEFAULT_GHUSER = os.environ["CORRECTOR_GH_USER"]
 
 # XXX Temporario 2020/1. Maneja a qué personas se les incluye
@@ -44,6 +59,39 @@ REVIEWEE_GRUPAL = {
 }
 
 
+class ReposIndex:
+    """Índice por legajo de la planilla de repositorios (PLANILLA_TSV).
+
+    El índice se construye una sola vez, y se reconstruye solamente si
+    cambian la fecha de modificación o el tamaño del archivo.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._stat_key: Optional[Tuple[int, int]] = None
+        self._rows: Dict[str, Dict[str, str]] = {}
+
+    def rows(self) -> Dict[str, Dict[str, str]]:
+        """Devuelve el diccionario de filas, indexado por legajo.
+        """
+        stat = os.stat(self._path)
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if stat_key != self._stat_key:
+                rows: Dict[str, Dict[str, str]] = {}
+                with open(self._path, newline="") as fileobj:
+                    for row in csv.DictReader(fileobj, dialect="excel-tab"):
+                        rows.setdefault(row["Legajo"], row)
+                self._rows, self._stat_key = rows, stat_key
+
+        return self._rows
+
+
+repos_index = ReposIndex(PLANILLA_TSV)
+
+
 class AluRepo:
     """Clase para manejar los repositorios individuales y grupales.
     """
@@ -64,6 +112,7 @@ class AluRepo:
         self.legajos = set(legajos)
         self.repo_full = repo_full
         self.github_users = github_users or [DEFAULT_GHUSER]
+        self.remote_url = f"git@github.com:{repo_full}"
 
     @classmethod
     def from_legajos(cls: Type[T], legajos: List[str], tp_id: str, /) -> T:
@@ -74,17 +123,9 @@ class AluRepo:
           ValueError si no hay repositorio configurado, o si los repositorios
               no coinciden para todos los legajos.
         """
-        rows = []
-        column = cls.DEFAULT_COLUMN
-
-        # TODO: mover esto a repos.yml
-        if tp_id in {"abb", "hash", "heap", "tp2", "tp3"}:
-            column = "Repo2"
-
-        with open(PLANILLA_TSV, newline="") as fileobj:
-            for row in csv.DictReader(fileobj, dialect="excel-tab"):
-                if row["Legajo"] in legajos:
-                    rows.append(row)
+        column = cls._column(tp_id)
+        index = repos_index.rows()
+        rows = [index[legajo] for legajo in legajos if legajo in index]
 
         if not rows:
             s = "s" if legajos[1:] else ""
@@ -109,6 +150,36 @@ class AluRepo:
 
         return cls(repo_full, legajos, github_names)
 
+    @classmethod
+    def from_tp(cls: Type[T], tp_id: str, /) -> List[T]:
+        """Devuelve todos los AluRepo configurados para una entrega.
+
+        Los legajos que comparten repositorio se agrupan en un mismo AluRepo.
+        Los legajos sin repositorio configurado se omiten.
+        """
+        column = cls._column(tp_id)
+        by_repo: Dict[str, List[Dict[str, str]]] = {}
+
+        for row in repos_index.rows().values():
+            if name := row[column]:
+                by_repo.setdefault(name, []).append(row)
+
+        return [
+            cls(
+                repo_full,
+                [row["Legajo"] for row in rows],
+                [ghuser for row in rows if (ghuser := row["Github"])],
+            )
+            for repo_full, rows in by_repo.items()
+        ]
+
+    @classmethod
+    def _column(cls, tp_id: str) -> str:
+        # TODO: mover esto a repos.yml
+        if tp_id in {"abb", "hash", "heap", "tp2", "tp3"}:
+            return "Repo2"
+        return cls.DEFAULT_COLUMN
+
     @property
     def url(self):
         return f"https://github.com/{self.repo_full}"
@@ -122,20 +193,16 @@ class AluRepo:
         Raises:
           github.GithubException si no se pudo crear el repositorio.
         """
-        gh = github.Github(GITHUB_TOKEN)
         try:
-            self.gh_repo = gh.get_repo(self.repo_full)
+            self.gh_repo = gh_client.get_repo(self.repo_full)
         except github.UnknownObjectException:
             pass
         else:
             return
 
-        owner, name = self.repo_full.split("/", 1)
-        organization = gh.get_organization(owner)
-
         # TODO: get all settings from repos.yml
-        organization.create_repo(
-            name,
+        gh_client.create_repo(
+            self.repo_full,
             private=True,
             has_wiki=False,
             has_projects=False,
@@ -147,11 +214,10 @@ class AluRepo:
         # TODO: poner skel_repo en la configuración.
         if skel_repo is not None:
             skel_repo = f"git@github.com:{skel_repo}"
-            repo_full = f"git@github.com:{self.repo_full}"
             with tempfile.TemporaryDirectory() as tmpdir:
                 git.Repo.clone_from(skel_repo, tmpdir)
                 git.cmd.Git(working_dir=tmpdir).push(
-                    [repo_full, "refs/remotes/origin/*:refs/heads/*"]
+                    [self.remote_url, "refs/remotes/origin/*:refs/heads/*"]
                 )
 
         # TODO: set up team access
@@ -162,7 +228,14 @@ class AluRepo:
         reviewees = REVIEWEE_GRUPAL if len(self.legajos) > 1 else REVIEWEE_INDIV
         return not self.legajos.isdisjoint(reviewees)
 
-    def sync(self, entrega_dir: pathlib.Path, rama: str, *, target_subdir: str = None):
+    def sync(
+        self,
+        entrega_dir: pathlib.Path,
+        rama: str,
+        *,
+        target_subdir: str = None,
+        low_priority: bool = False,
+    ):
         """Importa una entrega a los repositorios de alumnes.
 
         Args:
@@ -171,17 +244,114 @@ class AluRepo:
           target_subdir: directorio que se debe actuaizar dentro el repositorio.
               Si no se especifica, se usa el nombre de la rama (usar la cadena
               vacía para actualizar el toplevel).
+          low_priority: si es verdadero, se reserva una porción mayor del límite
+              de requests a la API (ver gh_client.check_budget).
+
+        Por omisión (CORRECTOR_SYNC_MODE=mirror) los commits se construyen en un
+        mirror local del repositorio, y se envían con un único `git push`. Si
+        eso falla, o con CORRECTOR_SYNC_MODE=rest, se usa la API de Github.
 
         Raises:
           github.UnknownObjectException si el repositorio no existe.
           github.GithubException si se recibió algún otro error de la API.
+          gh_client.RateBudgetExceeded si no quedan requests suficientes.
         """
         if target_subdir is None:
             target_subdir = rama
 
-        gh = github.Github(GITHUB_TOKEN)
-        repo = self.gh_repo or gh.get_repo(self.repo_full)
-        gitref = repo.get_git_ref(f"heads/{rama}")
+        if SYNC_MODE == "mirror":
+            try:
+                self._sync_mirror(entrega_dir, rama, target_subdir)
+            except (git.GitCommandError, subprocess.CalledProcessError) as ex:
+                print(f"sync local de {self.repo_full} falló: {ex}", file=sys.stderr)
+            else:
+                return
+
+        gh_client.check_budget(low_priority=low_priority)
+        self._sync_rest(entrega_dir, rama, target_subdir)
+
+    def _sync_mirror(self, entrega_dir: pathlib.Path, rama: str, target_subdir: str):
+        """Sincroniza una entrega usando un mirror local (ver sync).
+        """
+        mirror = self._update_mirror()
+        ghuser = random.choice(self.github_users)
+        prefix = target_subdir.rstrip("/") + "/"
+
+        # Examinar el repo de entregas para obtener los commits a aplicar.
+        entrega_repo = git.Repo(entrega_dir, search_parent_directories=True)
+        entrega_relpath = entrega_dir.relative_to(entrega_repo.working_dir).as_posix()
+        cur_sha = mirror.git.rev_parse(f"refs/heads/{rama}")
+        cur_date = mirror.commit(cur_sha).authored_date
+        pending_commits = _pending_commits(entrega_repo, entrega_relpath, cur_date)
+
+        if not pending_commits:
+            return
+
+        # Los blobs de la entrega se usan directamente desde el repo de entregas,
+        # sin copiarlos: `git push` los encuentra a través de "alternates".
+        _add_alternate(mirror, entrega_repo)
+
+        # Archivos presentes en la rama principal, que nunca se borran.
+        default_branch = mirror.git.symbolic_ref("HEAD")
+        preserve_files = set(
+            mirror.git.ls_tree(
+                "-r", "--name-only", "-z", default_branch, "--", prefix
+            ).split("\0")
+        )
+
+        with tempfile.TemporaryDirectory(dir=mirror.git_dir) as tmpdir:
+            plumbing = _Plumbing(mirror.git_dir, os.path.join(tmpdir, "index"))
+            plumbing("read-tree", cur_sha)
+
+            for commit in pending_commits:
+                entrega_tree = commit.tree.join(entrega_relpath)
+                entries = {
+                    path: (mode, sha)
+                    for sha, mode, path in traverse_tree_recursive(
+                        entrega_repo.odb, entrega_tree.binsha, prefix
+                    )
+                    # TODO: get exclusion list from repos.yml
+                    if not path.endswith("README.md")
+                }
+                cur_files = set(plumbing("ls-files", "-z", "--", prefix).split("\0"))
+                deletions = cur_files - set(entries) - preserve_files - {""}
+                index_info = [f"0 {NULL_SHA}\t{path}\n" for path in deletions]
+                index_info.extend(
+                    f"{mode:o} {sha.hex()}\t{path}\n"
+                    for path, (mode, sha) in entries.items()
+                )
+                plumbing("update-index", "--index-info", input="".join(index_info))
+                tree_sha = plumbing("write-tree")
+                author_tz = altz_to_utctz_str(commit.author_tz_offset)
+                author = (
+                    ghuser,
+                    f"{ghuser}@users.noreply.github.com",
+                    f"{commit.authored_date} {author_tz}",
+                )
+                commit_args = ["commit-tree", tree_sha, "-p", cur_sha]
+                cur_sha = plumbing(*commit_args, input=commit.message, author=author)
+
+        mirror.git.push("origin", f"{cur_sha}:refs/heads/{rama}")
+        mirror.git.update_ref(f"refs/heads/{rama}", cur_sha)
+
+    def _update_mirror(self) -> git.Repo:
+        """Devuelve el mirror local del repositorio, actualizado.
+        """
+        mirror_dir = MIRRORS_DIR / f"{self.repo_full}.git"
+        if not mirror_dir.exists():
+            mirror_dir.parent.mkdir(parents=True, exist_ok=True)
+            return git.Repo.clone_from(self.remote_url, mirror_dir, bare=True)
+
+        mirror = git.Repo(mirror_dir)
+        mirror.git.remote("set-url", "origin", self.remote_url)
+        mirror.git.fetch("--prune", "origin", "+refs/heads/*:refs/heads/*")
+        return mirror
+
+    def _sync_rest(self, entrega_dir: pathlib.Path, rama: str, target_subdir: str):
+        """Sincroniza una entrega usando la API REST de Github (ver sync).
+        """
+        repo = self.gh_repo or gh_client.get_repo(self.repo_full)
+        gitref = gh_client.get_git_ref(repo, f"heads/{rama}")
         ghuser = random.choice(self.github_users)  # ¯\_(ツ)_/¯ Only entregas knows.
         prefix_re = re.compile(re.escape(target_subdir.rstrip("/") + "/"))
 
@@ -189,31 +359,29 @@ class AluRepo:
         cur_sha = gitref.object.sha
         # NOTE: como solo trabajamos en un subdirectorio, se podría limitar el uso
         # de recursive a ese directorio (si trabajáramos con repos muy grandes).
-        cur_tree = repo.get_git_tree(cur_sha, recursive=True)
-        cur_commit = repo.get_git_commit(cur_sha)
+        cur_tree = gh_client.get_git_tree(repo, cur_sha, recursive=True)
+        cur_commit = gh_client.get_git_commit(repo, cur_sha)
 
         # Tree de la entrega en master, para manejar borrados.
-        baseref = repo.get_git_ref(f"heads/{repo.default_branch}")
-        base_tree = repo.get_git_tree(baseref.object.sha, recursive=True)
+        baseref = gh_client.get_git_ref(repo, f"heads/{repo.default_branch}")
+        base_tree = gh_client.get_git_tree(repo, baseref.object.sha, recursive=True)
 
         # Examinar el repo de entregas para obtener los commits a aplicar.
         entrega_repo = git.Repo(entrega_dir, search_parent_directories=True)
         entrega_relpath = entrega_dir.relative_to(entrega_repo.working_dir).as_posix()
-        pending_commits = []
         cur_commit_date = cur_commit.author.date
 
         # La fecha de la API siempre viene en UTC, pero PyGithub no le asigna
         # timezone, y se interpretaría en zona horaria local por omisión. Ver
         # https://github.com/PyGithub/PyGithub/pull/704.
         cur_commit_date = cur_commit_date.replace(tzinfo=timezone.utc)
+        pending_commits = _pending_commits(
+            entrega_repo, entrega_relpath, cur_commit_date.timestamp()
+        )
 
-        for commit in entrega_repo.iter_commits(paths=[entrega_relpath]):
-            if commit.authored_date > cur_commit_date.timestamp():
-                pending_commits.append(commit)
-
-        for commit in reversed(pending_commits):
+        for commit in pending_commits:
             entrega_tree = commit.tree.join(entrega_relpath)
-            tree_contents = tree_to_github(entrega_tree, target_subdir, repo)
+            tree_contents = tree_to_github(entrega_tree, target_subdir, repo, cur_tree)
             entrega_files = set(tree_contents.keys())
             tree_elements = list(tree_contents.values())
             tree_elements.extend(
@@ -223,22 +391,81 @@ class AluRepo:
             author_info = github.InputGitAuthor(
                 ghuser, f"{ghuser}@users.noreply.github.com", author_date.isoformat()
             )
-            cur_tree = repo.create_git_tree(tree_elements, cur_tree)
-            cur_commit = repo.create_git_commit(
-                commit.message, cur_tree, [cur_commit], author_info
+            cur_tree = gh_client.create_git_tree(repo, tree_elements, cur_tree)
+            cur_commit = gh_client.create_git_commit(
+                repo, commit.message, cur_tree, [cur_commit], author_info
             )
             # Se necesita obtener el árbol de manera recursiva para tener
             # los contenidos del subdirectorio de la entrega.
-            cur_tree = repo.get_git_tree(cur_tree.sha, recursive=True)
+            cur_tree = gh_client.get_git_tree(repo, cur_tree.sha, recursive=True)
+
+        gh_client.edit_git_ref(gitref, cur_commit.sha)
+
+
+def _pending_commits(
+    entrega_repo: git.Repo, entrega_relpath: str, since: float
+) -> List[git.Commit]:
+    """Devuelve, en orden cronológico, los commits de una entrega posteriores a `since`.
+    """
+    with CommitIndex(pathlib.Path(entrega_repo.working_dir)) as index:
+        shas = index.commits_since(entrega_relpath, since)
+    return [entrega_repo.commit(sha) for sha in shas]
 
-        gitref.edit(cur_commit.sha)
+
+class _Plumbing:
+    """Ejecuta comandos "plumbing" de Git sobre un índice temporal.
+    """
+
+    def __init__(self, git_dir: str, index_file: str):
+        self._git_dir = git_dir
+        self._env = {**os.environ, "GIT_INDEX_FILE": index_file}
+
+    def __call__(self, *args, input: str = None, author: Tuple[str, ...] = None):
+        env = self._env
+        if author is not None:
+            name, email, date = author
+            env = {
+                **env,
+                "GIT_AUTHOR_NAME": name,
+                "GIT_AUTHOR_EMAIL": email,
+                "GIT_AUTHOR_DATE": date,
+                "GIT_COMMITTER_NAME": name,
+                "GIT_COMMITTER_EMAIL": email,
+            }
+        return subprocess.run(
+            ["git", "--git-dir", self._git_dir, *args],
+            input=input,
+            env=env,
+            check=True,
+            capture_output=True,
+            encoding="utf-8",
+        ).stdout.strip()
+
+
+def _add_alternate(repo: git.Repo, other: git.Repo):
+    """Permite a `repo` usar los objetos de `other` sin copiarlos.
+    """
+    alternates = pathlib.Path(repo.git_dir) / "objects" / "info" / "alternates"
+    objects_dir = str(pathlib.Path(other.git_dir).resolve() / "objects")
+    current = alternates.read_text().splitlines() if alternates.exists() else []
+    if objects_dir not in current:
+        alternates.parent.mkdir(parents=True, exist_ok=True)
+        alternates.write_text("".join(f"{line}\n" for line in current + [objects_dir]))
 
 
 def tree_to_github(
-    tree: git.Tree, target_subdir: str, gh_repo: GithubRepo
+    tree: git.Tree,
+    target_subdir: str,
+    gh_repo: GithubRepo,
+    cur_tree: GithubTree = None,
 ) -> Dict[str, InputGitTreeElement]:
     """Extrae los contenidos de un commit de Git en formato Tree de Github.
 
+    Como el SHA de un blob depende solo de su contenido, los archivos cuyo
+    blob ya existe en `cur_tree` se referencian por SHA, sin enviarlos. De
+    los demás, los de texto se envían en el propio árbol, y los binarios se
+    suben con create_git_blob() en paralelo.
+
     Returns:
       un diccionario donde las claves son rutas en el repo, y los valores
       el InputGitTreeElement que los modifica.
@@ -246,30 +473,51 @@ def tree_to_github(
     odb = tree.repo.odb
     target_subdir = target_subdir.rstrip("/") + "/"
     entries = traverse_tree_recursive(odb, tree.binsha, target_subdir)
+    remote_blobs = set()
     contents = {}
-
-    for sha, mode, path in entries:
-        # TODO: get exclusion list from repos.yml
-        if path.endswith("README.md"):
-            continue
-        fileobj = io.BytesIO()
-        stream_copy(odb.stream(sha), fileobj)
-        fileobj.seek(0)
-        try:
-            text = fileobj.read().decode("utf-8")
-            input_elem = InputGitTreeElement(path, f"{mode:o}", "blob", text)
-        except UnicodeDecodeError:
-            # POST /trees solo permite texto, hay que crear un blob para binario.
-            fileobj.seek(0)
-            data = base64.b64encode(fileobj.read())
-            blob = gh_repo.create_git_blob(data.decode("ascii"), "base64")
-            input_elem = InputGitTreeElement(path, f"{mode:o}", "blob", sha=blob.sha)
-        finally:
-            contents[path] = input_elem
+    uploads = {}
+
+    if cur_tree is not None:
+        remote_blobs = {e.sha for e in cur_tree.tree if e.type == "blob"}
+
+    with ThreadPoolExecutor(max_workers=BLOB_UPLOAD_THREADS) as pool:
+        for sha, mode, path in entries:
+            # TODO: get exclusion list from repos.yml
+            if path.endswith("README.md"):
+                continue
+            if (hexsha := sha.hex()) in remote_blobs:
+                contents[path] = InputGitTreeElement(
+                    path, f"{mode:o}", "blob", sha=hexsha
+                )
+                continue
+            fileobj = io.BytesIO()
+            stream_copy(odb.stream(sha), fileobj)
+            data = fileobj.getvalue()
+            try:
+                text = data.decode("utf-8")
+                contents[path] = InputGitTreeElement(path, f"{mode:o}", "blob", text)
+            except UnicodeDecodeError:
+                # POST /trees solo permite texto, hay que crear un blob para binario.
+                future = pool.submit(_create_blob, gh_repo.full_name, data)
+                uploads[path] = (mode, future)
+
+    for path, (mode, future) in uploads.items():
+        blob_sha = future.result()
+        contents[path] = InputGitTreeElement(path, f"{mode:o}", "blob", sha=blob_sha)
 
     return contents
 
 
+def _create_blob(repo_full: str, data: bytes) -> str:
+    """Sube un blob binario a un repositorio, y devuelve su SHA.
+
+    Como los objetos de PyGithub no se pueden compartir entre hilos, se usa
+    el cliente propio del hilo.
+    """
+    content = base64.b64encode(data).decode("ascii")
+    return gh_client.create_git_blob(repo_full, content, "base64")
+
+
 def deleted_files(
     new_files: Set[str],
     cur_tree: GithubTree,
@@ -0,0 +1,143 @@
+"""Índice persistente de commits por entrega en el repositorio de entregas.
+
+Encontrar los commits de una entrega con `git log -- <ruta>` requiere recorrer
+toda la historia del repositorio, que crece con cada entrega. Este índice guarda,
+para cada entrega (su repo_relpath, p.ej. "pila/2020_1/54321"), la lista de sus
+commits con su fecha de autor, en una base SQLite dentro del directorio .git.
+
+El índice se actualiza de manera incremental: update() procesa solo los commits
+posteriores al último indexado (Moss lo llama tras cada commit). La primera vez,
+o si la historia fue reescrita, se indexa la historia completa.
+"""
+
+import pathlib
+import sqlite3
+import subprocess
+
+from typing import Iterable, List, Optional, Tuple
+
+
+__all__ = [
+    "CommitIndex",
+    "entrega_relpath",
+]
+
+INDEX_FILENAME = "entregas_index.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS commits (
+    relpath TEXT NOT NULL,
+    date INTEGER NOT NULL,
+    sha TEXT NOT NULL,
+    PRIMARY KEY (relpath, date, sha)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Separa los commits en la salida de `git log`.
+COMMIT_MARK = "\x1ecommit "
+
+
+def entrega_relpath(path: str) -> Optional[str]:
+    """Devuelve la ruta de la entrega a la que pertenece un archivo del repositorio.
+
+    Las entregas están en <tp>/<cuatri>/<legajos>, salvo los parcialitos, que
+    están en parcialitos/<cuatri>/<parcialito>/<legajos> (ver main.post).
+    """
+    parts = pathlib.PurePosixPath(path).parts if path else ()
+    depth = 4 if parts[:1] == ("parcialitos",) else 3
+    if len(parts) <= depth:
+        return None
+    return "/".join(parts[:depth])
+
+
+class CommitIndex:
+    """Índice de commits por entrega de un repositorio de entregas.
+    """
+
+    def __init__(self, repo_dir: pathlib.Path):
+        self._repo_dir = repo_dir
+        git_dir = self._git("rev-parse", "--absolute-git-dir").strip()
+        self._db = sqlite3.connect(pathlib.Path(git_dir) / INDEX_FILENAME, timeout=30)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def commits_since(self, relpath: str, timestamp: float) -> List[str]:
+        """Devuelve los commits de una entrega posteriores a una fecha.
+
+        Returns:
+          la lista de SHAs, en orden cronológico.
+        """
+        self.update()
+        rows = self._db.execute(
+            "SELECT sha FROM commits WHERE relpath = ? AND date > ? ORDER BY date",
+            (relpath, int(timestamp)),
+        )
+        return [sha for (sha,) in rows]
+
+    def update(self):
+        """Indexa los commits que aún no estaban en el índice.
+        """
+        head = self._git("rev-parse", "--verify", "-q", "HEAD", check=False).strip()
+        last = self._get_meta("last_indexed")
+
+        if not head or head == last:
+            return
+
+        with self._db:
+            if last and self._is_ancestor(last, head):
+                revs = f"{last}..{head}"
+            else:
+                # Primera indexación, o historia reescrita: se indexa todo de nuevo.
+                self._db.execute("DELETE FROM commits")
+                revs = head
+            self._db.executemany(
+                "INSERT OR IGNORE INTO commits (relpath, date, sha) VALUES (?, ?, ?)",
+                self._log_entries(revs),
+            )
+            self._set_meta("last_indexed", head)
+
+    def _log_entries(self, revs: str) -> Iterable[Tuple[str, int, str]]:
+        log = self._git(
+            "log", f"--format={COMMIT_MARK}%H %at", "--name-only", "-z", revs
+        )
+        for chunk in log.split(COMMIT_MARK)[1:]:
+            # Con -z, la cabecera termina en NUL, y cada nombre de archivo también.
+            header, _, names = chunk.partition("\0")
+            sha, date = header.split()
+            relpaths = {entrega_relpath(name.strip("\n")) for name in names.split("\0")}
+            for relpath in relpaths - {None}:
+                yield relpath, int(date), sha
+
+    def _is_ancestor(self, rev: str, head: str) -> bool:
+        cmd = ["git", "merge-base", "--is-ancestor", rev, head]
+        return subprocess.call(cmd, cwd=self._repo_dir, stderr=subprocess.DEVNULL) == 0
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        query = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,))
+        row = query.fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str):
+        self._db.execute("REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _git(self, *args, check: bool = True) -> str:
+        return subprocess.run(
+            ["git", *args],
+            cwd=self._repo_dir,
+            check=check,
+            capture_output=True,
+            encoding="utf-8",
+        ).stdout
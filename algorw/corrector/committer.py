@@ -0,0 +1,157 @@
+"""Commits en el repositorio de entregas desde varios workers a la vez.
+
+Con `git add` y `git commit`, todos los workers comparten el índice del
+repositorio (.git/index): si dos corrigen a la vez, uno falla por index.lock,
+o el commit de uno incluye archivos del otro. Por eso, cada commit se arma en
+dos pasos:
+
+  1. Cada worker agrega los archivos de su entrega a un índice temporal
+     propio (GIT_INDEX_FILE), y obtiene su árbol. Es la parte costosa (leer y
+     comprimir los archivos), y se hace en paralelo.
+
+  2. El commit se aplica con el lock del repositorio (un flock en su
+     directorio .git): se reemplaza en el árbol de HEAD el subárbol de la
+     entrega, y se avanza la rama con `git update-ref`. Los commits se aplican
+     así de a uno y en el orden en que se obtiene el lock, y cada uno parte
+     del anterior, aunque lo haya creado otro worker.
+
+El índice compartido (.git/index) no se usa para armar los commits, pero se
+actualiza al final del paso 2, con el mismo lock, para que `git status` en el
+repositorio no muestre como borrados o modificados los archivos de entregas
+ya guardadas.
+
+Además, las correcciones de una misma entrega (p.ej. dos envíos seguidos del
+mismo grupo) no se procesan a la vez, porque escriben en el mismo directorio:
+ver entrega_lock().
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+
+from typing import Iterator, Optional
+
+
+__all__ = [
+    "commit",
+    "entrega_lock",
+]
+
+COMMIT_LOCK = "entregas_commit.lock"
+ENTREGA_LOCKS = "entregas_locks"
+
+
+def commit(entrega_dir: pathlib.Path, message: str, date: str) -> Optional[str]:
+    """Hace commit de los contenidos de una entrega, sin usar el índice compartido.
+
+    Los archivos de la entrega (incluyendo los borrados) reemplazan a los del
+    último commit; el resto del repositorio no cambia.
+
+    Args:
+      entrega_dir: directorio de la entrega, dentro del repositorio.
+      message: el mensaje del commit.
+      date: la fecha de autor del commit (p.ej. el header Date de la entrega).
+
+    Returns:
+      el SHA del nuevo commit, o None si la entrega no cambió.
+    """
+    git_dir = _git_dir(entrega_dir)
+    relpath = _git(entrega_dir, "rev-parse", "--show-prefix").rstrip("/")
+
+    with tempfile.TemporaryDirectory(dir=git_dir, prefix="index_") as tmp_dir:
+        git = _Plumbing(entrega_dir, pathlib.Path(tmp_dir) / "index")
+        git("add", "--all", "--", ".")
+        subtree = git("write-tree", f"--prefix={relpath}/")
+
+        with _flock(git_dir / COMMIT_LOCK):
+            head = git("rev-parse", "-q", "--verify", "HEAD^{commit}", check=False)
+            if head:
+                git("read-tree", head)
+                # ":(top)" porque las rutas son relativas a entrega_dir.
+                pathspec = f":(top){relpath}"
+                git("rm", "-r", "-q", "--cached", "--ignore-unmatch", "--", pathspec)
+            else:
+                git("read-tree", "--empty")
+            git("read-tree", f"--prefix={relpath}/", subtree)
+            tree = git("write-tree")
+            if head and tree == git("rev-parse", f"{head}^{{tree}}"):
+                return None
+            parents = ["-p", head] if head else []
+            sha = git("commit-tree", tree, *parents, "-m", message, date=date)
+            # Con head vacío, update-ref verifica que la rama aún no exista.
+            git("update-ref", "-m", "commit (entregas)", "HEAD", sha, head)
+            _refresh_index(entrega_dir, sha)
+            return sha
+
+
+@contextlib.contextmanager
+def entrega_lock(entrega_dir: pathlib.Path) -> Iterator[None]:
+    """Impide que otro proceso use el directorio de una entrega a la vez.
+
+    El directorio debe existir, y estar dentro del repositorio.
+    """
+    git_dir = _git_dir(entrega_dir)
+    key = hashlib.sha1(str(entrega_dir.resolve()).encode("utf-8")).hexdigest()
+    locks_dir = git_dir / ENTREGA_LOCKS
+    locks_dir.mkdir(exist_ok=True)
+    with _flock(locks_dir / key):
+        yield
+
+
+@contextlib.contextmanager
+def _flock(path: pathlib.Path) -> Iterator[None]:
+    with open(path, "a") as lockfile:
+        fcntl.flock(lockfile, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+
+def _refresh_index(cwd: pathlib.Path, commit_sha: str):
+    """Pone el índice compartido al día con un commit.
+
+    Con -m, se conserva la información de stat de las entradas que no
+    cambiaron, y `git status` no necesita volver a leer sus archivos.
+    """
+    try:
+        _git(cwd, "read-tree", "-m", commit_sha)
+    except subprocess.CalledProcessError as ex:
+        # El commit ya está hecho; el índice se actualiza en el próximo.
+        print(f"no se pudo actualizar .git/index: {ex.stderr}", file=sys.stderr)
+
+
+def _git_dir(path: pathlib.Path) -> pathlib.Path:
+    return pathlib.Path(_git(path, "rev-parse", "--absolute-git-dir"))
+
+
+def _git(cwd: pathlib.Path, *args) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, encoding="utf-8"
+    ).stdout.strip()
+
+
+class _Plumbing:
+    """Ejecuta comandos de Git en un directorio, sobre un índice temporal.
+    """
+
+    def __init__(self, cwd: pathlib.Path, index_file: pathlib.Path):
+        self._cwd = cwd
+        self._env = {**os.environ, "GIT_INDEX_FILE": str(index_file)}
+
+    def __call__(self, *args, check: bool = True, date: str = None) -> str:
+        env = self._env if date is None else {**self._env, "GIT_AUTHOR_DATE": date}
+        result = subprocess.run(
+            ["git", *args],
+            cwd=self._cwd,
+            env=env,
+            check=check,
+            capture_output=True,
+            encoding="utf-8",
+        )
+        return result.stdout.strip()
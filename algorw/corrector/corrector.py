@@ -25,33 +25,44 @@ Salida:
 
   - un mensaje al alumno con los resultados.
 
-  - se guarda una copia de los archivos en DATA_DIR/<TP_ID>/<YYYY_CX>/<PADRON>.
+  - se guarda una copia de los archivos en DATA_DIR/<TP_ID>/<YYYY_CX>/<PADRON>
+    (o en el shard correspondiente, ver shards.py).
 """
 
+import atexit
 import datetime
 import email
 import email.message
 import email.policy
+import gzip
+import hashlib
 import io
 import os
 import pathlib
 import re
 import shutil
+import sqlite3
 import subprocess
 import sys
 import tarfile
+import time
 import zipfile
 
-from typing import Dict
+from typing import BinaryIO, Dict, Optional, Set
 
 from dotenv import load_dotenv
-from github import GithubException
+from redis import RedisError
 
-from config import Settings, load_config
+from config import Settings, load_config, reload_if_changed
 
 from .. import utils
+from ..common import events, metrics, timing
 from ..common.tasks import CorrectorTask
-from . import ai_corrector
+from . import ai_corrector, committer, notas, pusher, shards, similarity, skel_cache
+from .commit_index import CommitIndex
+from .generated import OUTPUT_LOG, README
+from .similarity import SimilarityIndex
+from .worker import WORKER_POOL_SIZE, WorkerPool, WorkerProcess
 
 
 load_dotenv()
@@ -59,13 +70,16 @@ load_dotenv()
 
 ROOT_DIR = pathlib.Path(os.environ["CORRECTOR_ROOT"])
 SKEL_DIR = ROOT_DIR / os.environ["CORRECTOR_SKEL"]
-DATA_DIR = ROOT_DIR / os.environ["CORRECTOR_TPS"]
+DATA_DIR = shards.DATA_DIR
 WORKER_BIN = ROOT_DIR / os.environ["CORRECTOR_WORKER"]
 GITHUB_URL = "https://github.com/" + os.environ["CORRECTOR_GH_REPO"]
 
 AUSENCIA_REGEX = re.compile(r" \(ausencia\)$")
 TODO_OK_REGEX = re.compile(r"^Todo OK$", re.M)
 
+# Trailer de los commits de Moss con el asunto del mail original (ver recorregir).
+SUBJECT_TRAILER = "Entrega-Subject"
+
 
 # Archivos que no aceptamos en las entregas.
 FORBIDDEN_EXTENSIONS = {
@@ -77,6 +91,9 @@ FORBIDDEN_EXTENSIONS = {
 
 cfg: Settings = load_config()
 
+# Pool de workers iniciados de antemano (ver start_worker).
+_worker_pool: Optional[WorkerPool] = None
+
 
 class ErrorInterno(Exception):
     """Excepción para cualquier error interno en el programa.
@@ -93,32 +110,69 @@ def corregir_entrega(task: CorrectorTask):
     """Función de corrección principal.
 
     El flujo de la corrección se corta lanzando excepciones ErrorAlumno.
+
+    La duración de cada corrección se registra por TP, para estimar el tiempo
+    de espera de las entregas en cola (ver algorw.app.queue), y la de cada
+    etapa en la traza de la entrega (ver algorw.common.traces).
     """
-    try:
-        procesar_entrega(task)
-    except ErrorAlumno as ex:
-        send_reply(task.orig_headers, f"ERROR: {ex}.")
-    except ErrorInterno as ex:
-        print(ex, file=sys.stderr)
+    started = time.monotonic()
+    reload_if_changed()
+    with timing.trace(task.trace_id):
+        try:
+            procesar_entrega(task)
+        except ErrorAlumno as ex:
+            notify(task, "line", f"ERROR: {ex}.")
+            notify(task, events.DONE, "error")
+            record_result(task, ok=False)
+            if result_changed(task, ok=False):
+                send_reply(task.orig_headers, f"ERROR: {ex}.")
+        except ErrorInterno as ex:
+            print(ex, file=sys.stderr)
+            notify(task, events.DONE, "interno")
+        finally:
+            elapsed = time.monotonic() - started
+            try:
+                metrics.sample(f"job_seconds:{task.tp_id}", elapsed)
+            except RedisError as ex:
+                # La métrica es informativa: no debe reemplazar al error original.
+                print(f"no se pudo registrar la duración: {ex}", file=sys.stderr)
 
 
 def procesar_entrega(task: CorrectorTask):
     """Recibe el mensaje del alumno y lanza el proceso de corrección.
     """
+    dest = shards.ensure(task.repo_relpath)
+    dest.mkdir(parents=True, exist_ok=True)
+    # Dos correcciones de la misma entrega escribirían en el mismo directorio.
+    with committer.entrega_lock(dest):
+        _procesar_entrega(task, dest)
+
+
+def _procesar_entrega(task: CorrectorTask, dest: pathlib.Path):
     subj = task.orig_headers["Subject"]
     tp_id = task.tp_id
     padron = "_".join(task.legajos)
     zip_obj = zipfile.ZipFile(io.BytesIO(task.zipfile))
     skel_dir = SKEL_DIR / tp_id
-    moss = Moss(DATA_DIR / task.repo_relpath)
-    commit_message = f"New {tp_id} upload from {padron}"
+    moss = Moss(dest, skel_dir=skel_dir)
+    if task.previous_ok is None:
+        commit_message = f"New {tp_id} upload from {padron}"
+    else:
+        commit_message = f"Re-run {tp_id} tests for {padron}"
+    commit_message += f"\n\n{SUBJECT_TRAILER}: {subj}"
+
+    with timing.span("zip_walk"):
+        zip_entries = list(zip_walk(zip_obj))
 
     if AUSENCIA_REGEX.search(subj):
         # No es una entrega real, por tanto no se envía al worker.
-        for path, zip_info in zip_walk(zip_obj):
+        for path, zip_info in zip_entries:
             moss.save_data(path, zip_obj.read(zip_info))
         moss.commit_emoji()
-        moss.flush(commit_message, task.orig_headers["Date"])
+        with timing.span("moss_commit"):
+            moss.flush(commit_message, task.orig_headers["Date"])
+        notify(task, "line", "Justificación registrada")
+        notify(task, events.DONE, "ok")
         send_reply(
             task.orig_headers,
             "Justificación registrada\n\n"
@@ -127,46 +181,49 @@ def procesar_entrega(task: CorrectorTask):
         )
         return
 
-    # Lanzar ya el proceso worker para poder pasar su stdin a tarfile.open().
-    worker = subprocess.Popen(
-        [WORKER_BIN],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-    )
+    # Se guardan todos los archivos antes de enviarlos al worker: si este
+    # termina sin leer toda su entrada, la entrega debe quedar completa igual.
+    for path, zip_info in zip_entries:
+        moss.save_data(path, zip_obj.read(zip_info))
 
-    tar = tarfile.open(fileobj=worker.stdin, mode="w|", dereference=True)
+    # La salida del worker se publica a medida que se produce (ver
+    # main.job_status).
+    publisher = events.OutputPublisher(task.job_id) if task.job_id else None
+    on_output = publisher.write if publisher else None
 
-    # Añadir al archivo TAR la base del TP (skel_dir).
-    for entry in os.scandir(skel_dir):
-        path = pathlib.PurePath(entry.path)
-        rel_path = path.relative_to(skel_dir)
-        tar.add(path, "skel" / rel_path)
+    # Lanzar ya el proceso worker para poder pasar su stdin a tarfile.open().
+    with start_worker(output_log=moss.output_log(), on_output=on_output) as worker:
+        with timing.span("tar"):
+            try:
+                send_tar(worker.stdin, skel_dir, zip_obj, zip_entries)
+            except BrokenPipeError:
+                # El worker terminó (o se lo terminó) sin leer toda la entrada.
+                pass
 
-    # A continuación añadir los archivos de la entrega (ZIP).
-    for path, zip_info in zip_walk(zip_obj):
-        info = tarfile.TarInfo(("orig" / path).as_posix())
-        info.size = zip_info.file_size
-        info.mtime = zip_datetime(zip_info).timestamp()
-        info.type, info.mode = tarfile.REGTYPE, 0o644
+        with timing.span("worker"):
+            output, retcode, killed = worker.wait()
 
-        moss.save_data(path, zip_obj.read(zip_info))
-        tar.addfile(info, zip_obj.open(zip_info.filename))
+    if publisher:
+        publisher.close()
 
-    tar.close()
-
-    stdout, _ = worker.communicate()
-    output = stdout.decode("utf-8")
-    retcode = worker.wait()
+    if killed:
+        output += f"\n\nERROR: {killed}. Se interrumpió la ejecución.\n"
+        notify(task, "line", f"ERROR: {killed}.")
 
     moss.save_output(f"{subj}\n\n{output}")
     moss.commit_emoji(output)
-    moss.flush(commit_message, task.orig_headers["Date"])
+    with timing.span("moss_commit"):
+        moss.flush(commit_message, task.orig_headers["Date"])
 
-    if retcode != 0:
+    if retcode != 0 and not killed:
         raise ErrorInterno(output)
 
     if TODO_OK_REGEX.search(output) and False:
+        # Se importan solo aquí: requieren PyGithub y GitPython, que son costosos.
+        from github import GithubException
+
+        from .alu_repos import AluRepo
+
         try:
             # Sincronizar la entrega con los repositorios individuales.
             alu_repo = AluRepo.from_legajos(padron.split("_"), tp_id)
@@ -187,7 +244,75 @@ def procesar_entrega(task: CorrectorTask):
 
     quote = ai_corrector.vida_corrector(tp_id)
     firma = "URL de esta entrega (para uso docente):\n" + moss.url()
-    send_reply(task.orig_headers, f"{quote}{output}\n\n-- \n{firma}")
+    todo_ok = TODO_OK_REGEX.search(output) is not None
+    notify(task, events.DONE, "ok" if todo_ok else "error")
+    record_result(task, ok=todo_ok)
+    if result_changed(task, ok=todo_ok):
+        send_reply(task.orig_headers, f"{quote}{output}\n\n-- \n{firma}")
+
+
+def send_tar(fileobj: BinaryIO, skel_dir: pathlib.Path, zip_obj, zip_entries):
+    """Envía al worker, como TAR, la base del TP (skel) y la entrega (orig).
+
+    Raises:
+      BrokenPipeError si el worker termina sin leer toda la entrada.
+    """
+    tar = tarfile.open(fileobj=fileobj, mode="w|", dereference=True)
+    try:
+        # Añadir al archivo TAR la base del TP (skel_dir).
+        for entry in os.scandir(skel_dir):
+            path = pathlib.PurePath(entry.path)
+            rel_path = path.relative_to(skel_dir)
+            tar.add(path, "skel" / rel_path)
+
+        # Y los objetos ya compilados de la base, si los hay (skel/.build).
+        skel_cache.add_to_tar(tar, skel_dir)
+
+        # A continuación añadir los archivos de la entrega (ZIP).
+        for path, zip_info in zip_entries:
+            info = tarfile.TarInfo(("orig" / path).as_posix())
+            info.size = zip_info.file_size
+            info.mtime = zip_datetime(zip_info).timestamp()
+            info.type, info.mode = tarfile.REGTYPE, 0o644
+            tar.addfile(info, zip_obj.open(zip_info.filename))
+
+        tar.close()
+    except BrokenPipeError:
+        # Para que tarfile no vuelva a intentar escribir al liberar el stream.
+        tar.fileobj.closed = True
+        raise
+
+
+def start_worker(**kwargs) -> WorkerProcess:
+    """Inicia un worker, tomándolo del pool si CORRECTOR_POOL_SIZE > 0.
+    """
+    global _worker_pool
+    if WORKER_POOL_SIZE <= 0:
+        return WorkerProcess([WORKER_BIN], **kwargs)
+    if _worker_pool is None:
+        _worker_pool = WorkerPool([WORKER_BIN], WORKER_POOL_SIZE)
+        atexit.register(_worker_pool.close)
+    return _worker_pool.start(**kwargs)
+
+
+def notify(task: CorrectorTask, event: str, data: str):
+    """Publica el progreso de la corrección, si la tarea tiene job_id.
+    """
+    if task.job_id:
+        events.publish(task.job_id, event, data)
+
+
+def record_result(task: CorrectorTask, *, ok: bool):
+    """Anota el resultado para la hoja Notas (ver notas.py), salvo en modo test.
+    """
+    if not cfg.test:
+        notas.record(task.tp_id, task.legajos, ok)
+
+
+def result_changed(task: CorrectorTask, *, ok: bool) -> bool:
+    """Indica si hay que responder: siempre, salvo re-correcciones sin cambios.
+    """
+    return task.previous_ok is None or task.previous_ok != ok
 
 
 def is_forbidden(path):
@@ -241,13 +366,25 @@ def zip_walk(zip_obj, strip_toplevel=True):
 
 class Moss:
     """Guarda código fuente del alumno.
+
+    Los archivos se escriben de manera incremental: si un archivo ya estaba
+    guardado con idéntico contenido, no se lo vuelve a escribir; y al hacer
+    flush() se borran los archivos de la entrega anterior que no forman parte
+    de la actual. Así, el commit representa siempre la entrega completa, pero
+    Git solo tiene que procesar los archivos que cambiaron.
+
+    Al hacer flush(), además, se agrega la entrega al índice de similitud de
+    código (ver similarity.py), sin contar el código base del TP (skel_dir).
     """
 
-    def __init__(self, dest: pathlib.Path):
+    def __init__(self, dest: pathlib.Path, skel_dir: pathlib.Path = None):
         self._dest = dest
+        self._skel_dir = skel_dir
         self._emoji = None
-        shutil.rmtree(self._dest, ignore_errors=True)
-        self._dest.mkdir(parents=True)
+        self._commit: Optional[str] = None
+        self._saved: Set[pathlib.PurePath] = set()
+        self._sources: Dict[str, bytes] = {}
+        self._dest.mkdir(parents=True, exist_ok=True)
 
     def location(self):
         """Directorio donde se guardaron los archivos.
@@ -255,41 +392,118 @@ class Moss:
         return self._dest
 
     def url(self):
-        short_rev = "git show -s --pretty=tformat:%h"
-        relative_dir = "git rev-parse --show-prefix"
-        return subprocess.check_output(
-            f'echo "{GITHUB_URL}/tree/$({short_rev})/$({relative_dir})"',
-            shell=True,
+        # Con shards, cada repositorio tiene su propia URL (ver shards.py).
+        base_url = (shards.SHARDING and shards.web_url(self._dest)) or GITHUB_URL
+        # HEAD puede incluir ya commits de otros workers (ver committer.py).
+        short_rev = subprocess.check_output(
+            ["git", "rev-parse", "--short", self._commit or "HEAD"],
             encoding="utf-8",
             cwd=self._dest,
-        )
+        ).strip()
+        return f"{base_url}/tree/{short_rev}/{self._relpath()}/\n"
 
     def save_data(self, relpath, contents):
-        """Guarda un archivo si es código fuente.
+        """Guarda un archivo de la entrega.
 
-        Devuelve True si se guardó, False si se decidió no guardarlo.
+        Si es código fuente, se lo agrega además al índice de similitud.
         """
-        path = self._dest / relpath
-        path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_bytes(contents)
-        return self._git(["add", relpath]) == 0
+        relpath = pathlib.PurePath(relpath)
+        self._write(relpath, contents)
+        if relpath.suffix in similarity.SOURCE_SUFFIXES:
+            self._sources[relpath.as_posix()] = contents
 
     def flush(self, message: str, date: str):  # TODO: pass datetime?
         """Termina de guardar los archivos en el repositorio.
+
+        El commit es local, y no usa el índice compartido del repositorio (ver
+        committer.py); el push lo hace en segundo plano el daemon de pusher.py,
+        que agrupa los commits de varias correcciones.
         """
         if self._emoji:
             message = f"{self._emoji} {message}"
-        self._git(["add", "--no-ignore-removal", "."])
-        self._git(["commit", "-m", message, "--date", date])
-        self._git(["push", "--force-with-lease", "origin", ":"])
+        self._remove_stale()
+        try:
+            self._commit = committer.commit(self._dest, message, date)
+        except subprocess.CalledProcessError as ex:
+            print(f"no se pudo hacer commit: {ex.stderr}", file=sys.stderr)
+            return
+        self._update_index()
+        self._update_similarity()
+        pusher.request_push(self._dest, trace_id=timing.current_trace())
+
+    def _update_index(self):
+        """Agrega el nuevo commit al índice de commits por entrega.
+        """
+        try:
+            with CommitIndex(self._dest) as index:
+                index.update()
+        except (sqlite3.Error, subprocess.CalledProcessError) as ex:
+            # El índice se pone al día en la próxima actualización.
+            print(f"no se pudo actualizar el índice de commits: {ex}", file=sys.stderr)
+
+    def _update_similarity(self):
+        """Agrega la entrega al índice de similitud, y registra sus coincidencias.
+        """
+        try:
+            relpath = self._relpath()
+            prints = similarity.source_fingerprints(self._sources)
+            base = similarity.base_fingerprints(self._skel_dir)
+            with SimilarityIndex(self._dest) as index:
+                index.add(relpath, prints, base)
+        except (sqlite3.Error, subprocess.CalledProcessError, ValueError) as ex:
+            print(f"no se pudo actualizar índice de similitud: {ex}", file=sys.stderr)
+
+    def _relpath(self) -> str:
+        """Ruta de la entrega dentro de su repositorio (p.ej. pila/2020_1/54321).
+        """
+        prefix = subprocess.check_output(
+            ["git", "rev-parse", "--show-prefix"], cwd=self._dest, encoding="utf-8"
+        )
+        return prefix.strip().rstrip("/")
+
+    def _write(self, relpath: pathlib.PurePath, contents: bytes):
+        """Escribe un archivo, salvo que ya exista con el mismo contenido.
+        """
+        path = self._dest / relpath
+        self._saved.add(relpath)
+
+        if _same_contents(path, contents):
+            return
+
+        # Una entrega anterior pudo tener un directorio donde ahora hay un
+        # archivo, o viceversa.
+        for parent in reversed(list(relpath.parents)[:-1]):
+            if (self._dest / parent).is_file():
+                (self._dest / parent).unlink()
+        if path.is_dir():
+            shutil.rmtree(path)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(contents)
 
-    def _git(self, args):
-        subprocess.call(["git"] + args, cwd=self._dest)
+    def _remove_stale(self):
+        """Borra los archivos que no forman parte de la entrega actual.
+        """
+        for dirpath, _, filenames in os.walk(self._dest, topdown=False):
+            parent = pathlib.Path(dirpath)
+            for name in filenames:
+                if (parent / name).relative_to(self._dest) not in self._saved:
+                    (parent / name).unlink()
+            if parent != self._dest and not any(parent.iterdir()):
+                parent.rmdir()
+
+    def output_log(self) -> BinaryIO:
+        """Devuelve un archivo donde guardar, comprimida, la salida completa.
+        """
+        relpath = pathlib.PurePath(OUTPUT_LOG)
+        self._saved.add(relpath)
+        # Con mtime=0, la misma salida produce siempre el mismo archivo.
+        return gzip.GzipFile(self._dest / relpath, "wb", mtime=0)
 
     def save_output(self, output):
-        filepath = self._dest / "README.md"
-        filepath.write_text(f"```\n{output}```")
-        return self._git(["add", filepath]) == 0
+        readme = f"```\n{output}```"
+        self._write(pathlib.PurePath(README), readme.encode("utf-8"))
+        return True
 
     def commit_emoji(self, output=None):
         if output is None:
@@ -300,6 +514,20 @@ class Moss:
             self._emoji = ":x:"
 
 
+def _same_contents(path: pathlib.Path, contents: bytes) -> bool:
+    """Indica si un archivo existente tiene exactamente los contenidos dados.
+
+    Se compara primero el tamaño, que no requiere leer el archivo.
+    """
+    try:
+        if path.stat().st_size != len(contents):
+            return False
+        existing = hashlib.sha1(path.read_bytes()).digest()
+        return existing == hashlib.sha1(contents).digest()
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return False
+
+
 def zip_datetime(info):
     """Gets a datetime.datetime from a ZipInfo object.
     """
@@ -317,7 +545,6 @@ def send_reply(orig_headers: Dict[str, str], reply_text: str):
         print("ENVIARÍA: {}".format(reply_text), file=sys.stderr)
         return
 
-    creds = utils.get_oauth_credentials(cfg)
     reply = email.message.Message(email.policy.default)
     reply.set_payload(reply_text, "utf-8")
 
@@ -326,4 +553,6 @@ def send_reply(orig_headers: Dict[str, str], reply_text: str):
     reply["Subject"] = "Re: " + orig_headers["Subject"]
     reply["In-Reply-To"] = orig_headers["Message-ID"]
 
-    return utils.sendmail(reply, creds)
+    with timing.span("reply"):
+        creds = utils.get_oauth_credentials(cfg)
+        return utils.sendmail(reply, creds)
@@ -0,0 +1,188 @@
+"""Exportación de la última entrega de cada alumne de un TP, como un ZIP.
+
+Uso:
+
+    python -m algorw.corrector.export TP_ID [--cuatri 2020_1] [--docente NOMBRE]
+                                            [-o entregas.zip]
+
+También se puede descargar desde la aplicación web (ver main.export).
+
+El ZIP se genera a medida que se lo envía (stream_zip), sin archivos temporales
+y con memoria constante: en el repositorio de entregas, cada directorio de
+entrega contiene siempre la última versión, así que basta con recorrerlos.
+"""
+
+import argparse
+import io
+import pathlib
+import re
+import sys
+import zipfile
+
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import load_config
+
+from . import shards
+from .generated import GENERATED_FILES
+
+
+__all__ = [
+    "GENERATED_FILES",
+    "docente_filter",
+    "entregas_dir",
+    "entregas_relpath",
+    "iter_files",
+    "stream_zip",
+    "zip_entrega",
+]
+
+CHUNK_SIZE = 64 * 1024
+TP_ID_REGEX = re.compile(r"^[\w-]+$")
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Destino de ZipFile que acumula lo escrito hasta que se lo retira.
+
+    Como no implementa seek(), ZipFile escribe cada archivo en una sola pasada
+    (con "data descriptors" en lugar de volver a completar los encabezados).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._pending = 0
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._pending += len(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self._pending = 0
+        return data
+
+
+def entregas_dir(tp_id: str, cuatri: str) -> pathlib.Path:
+    """Devuelve el directorio con las entregas de un TP (o parcialito).
+
+    Raises:
+      ValueError si el TP o el cuatrimestre no son válidos.
+    """
+    return shards.locate(entregas_relpath(tp_id, cuatri))
+
+
+def entregas_relpath(tp_id: str, cuatri: str) -> pathlib.PurePosixPath:
+    """Como entregas_dir, pero devuelve la ruta dentro de su repositorio.
+    """
+    if not TP_ID_REGEX.match(tp_id) or not shards.CUATRI_REGEX.match(cuatri):
+        raise ValueError(f"TP o cuatrimestre inválido: {tp_id!r}, {cuatri!r}")
+    # Ver la ruta de los parcialitos en main.post.
+    parcialito = pathlib.PurePosixPath("parcialitos", cuatri, tp_id)
+    if shards.locate(parcialito).is_dir():
+        return parcialito
+    return pathlib.PurePosixPath(tp_id, cuatri)
+
+
+def docente_filter(correctores: Dict[str, str], docente: str) -> Callable[[str], bool]:
+    """Devuelve una función que indica si una entrega corresponde a le docente.
+
+    Args:
+      correctores: el diccionario Planilla.correctores (de legajo o
+          "g" + legajo, a nombre de docente).
+      docente: nombre de le docente.
+    """
+
+    def keep(entrega: str) -> bool:
+        legajos = entrega.split("_")
+        # Las entregas grupales tienen varios legajos; las individuales, uno.
+        keys = [f"g{x}" for x in legajos] if len(legajos) > 1 else legajos
+        return any(correctores.get(key) == docente for key in keys)
+
+    return keep
+
+
+def iter_files(
+    base_dir: pathlib.Path, keep: Callable[[str], bool] = None
+) -> Iterator[Tuple[pathlib.Path, str]]:
+    """Recorre los archivos de las entregas de un directorio.
+
+    Produce pares (ruta, nombre en el archivo), con las entregas bajo un
+    directorio con el nombre de base_dir (p.ej. "2020_1/54321/pila.c").
+    """
+    for entrega in sorted(p for p in base_dir.iterdir() if p.is_dir()):
+        if keep is not None and not keep(entrega.name):
+            continue
+        for path in sorted(entrega.rglob("*")):
+            if path.is_file():
+                yield path, f"{base_dir.name}/{path.relative_to(base_dir).as_posix()}"
+
+
+def stream_zip(files: Iterable[Tuple[pathlib.Path, str]]) -> Iterator[bytes]:
+    """Genera un archivo ZIP por partes, a medida que se leen los archivos.
+    """
+    buf = _StreamBuffer()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zip_obj:
+        for path, arcname in files:
+            info = zipfile.ZipInfo.from_file(path, arcname)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with path.open("rb") as src, zip_obj.open(info, "w") as dest:
+                while chunk := src.read(CHUNK_SIZE):
+                    dest.write(chunk)
+                    if buf.pending >= CHUNK_SIZE:
+                        yield buf.take()
+    # Al cerrar el ZIP se escribe el directorio central.
+    yield buf.take()
+
+
+def zip_entrega(entrega_dir: pathlib.Path) -> bytes:
+    """Arma un ZIP con los archivos de una entrega archivada, como los envió.
+    """
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zip_obj:
+        for path in sorted(entrega_dir.rglob("*")):
+            relpath = path.relative_to(entrega_dir)
+            if path.is_file() and relpath.as_posix() not in GENERATED_FILES:
+                zip_obj.write(path, relpath.as_posix())
+    return buf.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("tp_id", help="identificador del TP, p.ej. hash")
+    parser.add_argument("--cuatri", help="cuatrimestre (por omisión, el actual)")
+    parser.add_argument("--docente", help="solo las entregas de este docente")
+    parser.add_argument("-o", "--output", type=pathlib.Path, help="archivo ZIP")
+    args = parser.parse_args()
+
+    cuatri = args.cuatri or load_config().cuatri
+    base_dir = entregas_dir(args.tp_id.lower(), cuatri)
+    keep: Optional[Callable[[str], bool]] = None
+    if args.docente:
+        from planilla import fetch_planilla  # Solo si hace falta la planilla.
+
+        keep = docente_filter(fetch_planilla().correctores, args.docente)
+
+    output = args.output.open("wb") if args.output else sys.stdout.buffer
+    with output:
+        for chunk in stream_zip(iter_files(base_dir, keep)):
+            output.write(chunk)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,19 @@
+"""Archivos que el corrector agrega a cada entrega, y que no son parte de ella.
+
+Es un módulo aparte para que quienes solo los necesitan (p.ej. export.py, desde
+la aplicación web) no carguen el corrector completo.
+"""
+
+__all__ = [
+    "GENERATED_FILES",
+    "OUTPUT_LOG",
+    "README",
+]
+
+# Resultado de la corrección, para ver en Github.
+README = "README.md"
+
+# Salida completa del worker, junto al README.md de la entrega.
+OUTPUT_LOG = "output.txt.gz"
+
+GENERATED_FILES = frozenset({README, OUTPUT_LOG})
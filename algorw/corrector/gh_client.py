@@ -0,0 +1,244 @@
+"""Cliente de Github compartido por todo el proceso.
+
+En lugar de crear un objeto github.Github en cada operación, se mantiene un
+cliente de larga duración, que reutiliza sus conexiones HTTP. Como PyGithub no
+permite usar un mismo cliente desde varios hilos (cada Requester tiene una
+única conexión), hay un cliente por hilo. Además:
+
+  - los objetos que pueden cambiar (repositorios y refs) se guardan en caché y,
+    al reutilizarlos, se revalidan con update(), que envía If-None-Match e
+    If-Modified-Since; las respuestas 304 no cuentan para el límite de la API.
+
+  - los objetos inmutables (trees y commits, identificados por su SHA) se
+    guardan en caché sin necesidad de revalidarlos.
+
+  - se lleva la cuenta de las requests disponibles, para que el trabajo de baja
+    prioridad se postergue (RateBudgetExceeded) antes de recibir un 403.
+
+  - las requests tienen timeout, se reintentan ante errores 5xx o de red, y
+    si Github falla repetidamente se deja de intentar por un tiempo (ver
+    resilience.breaker). Los 4xx (p.ej. un repositorio inexistente) no cuentan
+    como fallas. Esto incluye las escrituras (create_git_blob, etc.), pero
+    solo se reintentan las idempotentes: no create_repo, que fallaría si el
+    primer intento llegó a crear el repositorio.
+
+La URL de la API se puede cambiar con CORRECTOR_GH_API (p.ej. para usar un
+servidor local que simule fallas).
+"""
+
+import os
+import threading
+
+from typing import Dict, List, Tuple
+
+import cachetools  # type: ignore
+import github
+import requests
+
+from github.GitCommit import GitCommit
+from github.GitRef import GitRef
+from github.GitTree import GitTree
+from github.InputGitAuthor import InputGitAuthor
+from github.InputGitTreeElement import InputGitTreeElement
+from github.Repository import Repository
+
+from ..common import metrics
+from ..common.resilience import TIMEOUTS, breaker
+
+
+__all__ = [
+    "RateBudgetExceeded",
+    "check_budget",
+    "client",
+    "create_git_blob",
+    "create_git_commit",
+    "create_git_tree",
+    "create_repo",
+    "edit_git_ref",
+    "ensure_repo",
+    "get_git_commit",
+    "get_git_ref",
+    "get_git_tree",
+    "get_repo",
+]
+
+GITHUB_TOKEN = os.environ["CORRECTOR_GH_TOKEN"]
+GITHUB_API = os.environ.get("CORRECTOR_GH_API", "https://api.github.com")
+
+# Requests que se reservan: el trabajo de baja prioridad (p.ej. sincronización
+# masiva) no se ejecuta si quedan menos de LOW_PRIORITY_RESERVE; el resto, si
+# quedan menos de MIN_RESERVE.
+LOW_PRIORITY_RESERVE = 1000
+MIN_RESERVE = 50
+
+_local = threading.local()
+_immutable_lock = threading.Lock()
+_immutable: cachetools.LRUCache = cachetools.LRUCache(maxsize=512)
+
+
+class RateBudgetExceeded(Exception):
+    """Se agotó el presupuesto de requests a la API de Github.
+    """
+
+    def __init__(self, remaining: int, reset_time: int):
+        super().__init__(f"quedan {remaining} requests a la API hasta {reset_time}")
+        self.remaining = remaining
+        self.reset_time = reset_time
+
+
+def client() -> github.Github:
+    """Devuelve el cliente de Github del hilo actual.
+    """
+    if (gh := getattr(_local, "github", None)) is None:
+        gh = _local.github = github.Github(
+            GITHUB_TOKEN, base_url=GITHUB_API, timeout=int(TIMEOUTS["github"])
+        )
+        _local.conditional = {}
+    return gh
+
+
+def check_budget(*, low_priority: bool = False):
+    """Verifica que quedan suficientes requests para la API de Github.
+
+    Raises:
+      RateBudgetExceeded si quedan menos requests que las reservadas.
+    """
+    gh = client()
+    remaining, _ = _call(lambda: gh.rate_limiting)
+    metrics.gauge("github_rate_remaining", remaining)
+    if remaining < (LOW_PRIORITY_RESERVE if low_priority else MIN_RESERVE):
+        raise RateBudgetExceeded(remaining, gh.rate_limiting_resettime)
+
+
+def ensure_repo(full_name: str, *, private: bool = True) -> Repository:
+    """Obtiene un repositorio de una organización, creándolo si no existe.
+    """
+    try:
+        return get_repo(full_name)
+    except github.UnknownObjectException:
+        return create_repo(full_name, private=private)
+
+
+def create_repo(full_name: str, **kwargs) -> Repository:
+    """Crea un repositorio en una organización (sin reintentos).
+
+    Los argumentos se pasan a Organization.create_repo.
+    """
+    owner, name = full_name.split("/", 1)
+    organization = _call(lambda: client().get_organization(owner))
+    return _call(lambda: organization.create_repo(name, **kwargs), retry=False)
+
+
+def get_repo(full_name: str) -> Repository:
+    """Obtiene un repositorio, con revalidación condicional.
+
+    Raises:
+      github.UnknownObjectException si el repositorio no existe.
+    """
+    return _conditional(("repo", full_name), lambda: client().get_repo(full_name))
+
+
+def get_git_ref(repo: Repository, ref: str) -> GitRef:
+    """Obtiene una referencia de un repositorio, con revalidación condicional.
+    """
+    key = ("ref", repo.full_name, ref)
+    return _conditional(key, lambda: _local_repo(repo).get_git_ref(ref))
+
+
+def get_git_tree(repo: Repository, sha: str, recursive: bool = False) -> GitTree:
+    """Obtiene un tree (inmutable) de un repositorio.
+    """
+    key = ("tree", repo.full_name, sha, recursive)
+    return _immutable_get(key, lambda: _local_repo(repo).get_git_tree(sha, recursive))
+
+
+def get_git_commit(repo: Repository, sha: str) -> GitCommit:
+    """Obtiene un commit (inmutable) de un repositorio.
+    """
+    key = ("commit", repo.full_name, sha)
+    return _immutable_get(key, lambda: _local_repo(repo).get_git_commit(sha))
+
+
+# Las escrituras en la base de objetos de Git son idempotentes: un objeto con
+# el mismo contenido tiene el mismo SHA (en un commit, salvo la fecha del
+# committer, y un commit repetido queda huérfano); y mover una ref a un SHA
+# dado deja el mismo resultado aunque se repita.
+
+
+def create_git_blob(repo_full: str, content: str, encoding: str) -> str:
+    """Sube un blob a un repositorio, con el cliente del hilo; devuelve su SHA.
+    """
+    repo = client().get_repo(repo_full, lazy=True)
+    return _call(lambda: repo.create_git_blob(content, encoding)).sha
+
+
+def create_git_tree(
+    repo: Repository, elements: List[InputGitTreeElement], base_tree: GitTree
+) -> GitTree:
+    """Crea un tree en un repositorio, a partir de otro.
+    """
+    return _call(lambda: repo.create_git_tree(elements, base_tree))
+
+
+def create_git_commit(
+    repo: Repository,
+    message: str,
+    tree: GitTree,
+    parents: List[GitCommit],
+    author: InputGitAuthor,
+) -> GitCommit:
+    """Crea un commit en un repositorio.
+    """
+    return _call(lambda: repo.create_git_commit(message, tree, parents, author))
+
+
+def edit_git_ref(gitref: GitRef, sha: str):
+    """Mueve una referencia (sin forzar: solo si es fast-forward).
+    """
+    _call(lambda: gitref.edit(sha))
+
+
+def _conditional(key: Tuple, fetch):
+    """Devuelve un objeto de la caché del hilo, revalidándolo con update().
+    """
+    client()
+    cache: Dict[Tuple, github.GithubObject.CompletableGithubObject] = _local.conditional
+    if (obj := cache.get(key)) is not None:
+        _call(obj.update)  # Si no cambió, es una respuesta 304.
+    else:
+        obj = cache[key] = _call(fetch)
+    return obj
+
+
+def _immutable_get(key: Tuple, fetch):
+    with _immutable_lock:
+        if (obj := _immutable.get(key)) is not None:
+            return obj
+    obj = _call(fetch)
+    with _immutable_lock:
+        _immutable[key] = obj
+    return obj
+
+
+def _call(fetch, *, retry: bool = True):
+    """Llama a la API de Github a través de su circuit breaker.
+
+    Con retry=False, no se reintenta (para las operaciones no idempotentes).
+    """
+    cb = breaker(
+        "github",
+        failures=(github.GithubException, requests.RequestException),
+        is_failure=_is_failure,
+    )
+    return cb.call(fetch) if retry else cb.call_once(fetch)
+
+
+def _is_failure(ex: BaseException) -> bool:
+    # Los errores 4xx son del pedido, no de Github.
+    return not isinstance(ex, github.GithubException) or ex.status >= 500
+
+
+def _local_repo(repo: Repository) -> Repository:
+    """Devuelve un repositorio que usa el cliente del hilo actual.
+    """
+    return client().get_repo(repo.full_name, lazy=True)
@@ -0,0 +1,250 @@
+"""Registro de los resultados de las correcciones en la hoja Notas.
+
+El corrector anota cada resultado en Redis (record), y este módulo, que uWSGI
+ejecuta como daemon (ver entregas.ini), los escribe en la planilla cada
+FLUSH_INTERVAL segundos, con una única llamada a values.batchUpdate para todas
+las celdas. Así se respeta la cuota de la API de Sheets (unas pocas requests
+por minuto, sin importar cuántas entregas haya).
+
+Los resultados se guardan en un hash de Redis con una clave por TP y legajo:
+si une alumne entrega varias veces antes de la escritura, solo se escribe el
+último resultado.
+
+La celda de cada resultado se ubica en la hoja Notas como en
+Planilla._parse_notas: la fila por la columna "Padrón", y la columna por el
+nombre del TP (p.ej. "Pila"; sin distinguir mayúsculas). No se sobrescriben las
+celdas que ya tengan otro valor (p.ej. una nota puesta por le docente): solo
+las vacías o con un resultado anterior del corrector. Los resultados sin celda
+(p.ej. parcialitos, o legajos que no están en Notas) se descartan.
+
+La API se puede reemplazar: NotasWriter recibe cualquier objeto con los
+métodos de Sheet (p.ej. uno en memoria, para pruebas), y GoogleSheet acepta
+una URL alternativa (CORRECTOR_SHEETS_API).
+"""
+
+import logging
+import os
+import random
+import sys
+import time
+
+from typing import Dict, Iterable, List, Protocol, Tuple
+
+from redis import Redis
+
+from ..common import metrics
+from ..common.resilience import breaker
+from ..planilla import Hojas
+
+
+__all__ = [
+    "GoogleSheet",
+    "NotasWriter",
+    "Sheet",
+    "record",
+]
+
+NOTAS_KEY = "entregas:notas"
+FLUSH_INTERVAL = float(os.environ.get("CORRECTOR_NOTAS_INTERVAL", 30))
+MAX_BACKOFF = 600
+
+TODO_OK = "Todo OK"
+CON_ERRORES = "Con errores"
+RESULTADOS = {TODO_OK, CON_ERRORES}
+
+PADRON_HEADER = "Padrón"
+
+redis_conn = Redis()
+logger = logging.getLogger(__name__)
+
+
+class Sheet(Protocol):
+    """Operaciones de la planilla que usa NotasWriter.
+    """
+
+    def read(self, range_: str) -> List[List]:
+        """Devuelve los valores de un rango (p.ej. "Notas"), por filas.
+        """
+
+    def batch_update(self, data: List[Dict]):
+        """Escribe varios rangos, con el formato de values.batchUpdate.
+        """
+
+
+class GoogleSheet:
+    """Planilla de Google Sheets, a través de su API.
+    """
+
+    def __init__(self, spreadsheet_id: str, credentials, api_endpoint: str = None):
+        from ..sheets import build_service
+
+        self._spreadsheet_id = spreadsheet_id
+        self._values = build_service(credentials, api_endpoint).spreadsheets().values()
+        self._breaker = breaker("sheets_write")
+
+    def read(self, range_: str) -> List[List]:
+        # Como en Planilla: con FORMATTED_VALUE, un padrón con formato de número
+        # (p.ej. "98.765") no coincidiría con el legajo.
+        query = self._values.get(
+            spreadsheetId=self._spreadsheet_id,
+            range=range_,
+            valueRenderOption="UNFORMATTED_VALUE",
+        )
+        return self._breaker.call(query.execute).get("values", [])
+
+    def batch_update(self, data: List[Dict]):
+        body = {"valueInputOption": "USER_ENTERED", "data": data}
+        query = self._values.batchUpdate(spreadsheetId=self._spreadsheet_id, body=body)
+        self._breaker.call(query.execute)
+
+
+def record(tp_id: str, legajos: Iterable[str], ok: bool):
+    """Anota el resultado de una corrección, para escribirlo en Notas.
+    """
+    value = TODO_OK if ok else CON_ERRORES
+    redis_conn.hset(NOTAS_KEY, mapping={_field(tp_id, x): value for x in legajos})
+
+
+class NotasWriter:
+    """Escribe en la hoja Notas los resultados pendientes.
+    """
+
+    def __init__(self, sheet: Sheet):
+        self._sheet = sheet
+
+    def flush(self) -> int:
+        """Escribe los resultados pendientes.
+
+        Si la escritura falla, los resultados vuelven a quedar pendientes
+        (salvo que, mientras tanto, se haya anotado uno más nuevo).
+
+        Returns:
+          la cantidad de celdas escritas.
+        """
+        pending = _take_pending()
+        if not pending:
+            return 0
+        try:
+            data = self.updates(pending)
+            if data:
+                self._sheet.batch_update(data)
+        except Exception:
+            _restore_pending(pending)
+            raise
+        return len(data)
+
+    def updates(self, pending: Dict[Tuple[str, str], str]) -> List[Dict]:
+        """Ubica en Notas la celda de cada resultado pendiente.
+
+        Args:
+          pending: diccionario de (tp_id, legajo) a resultado.
+
+        Returns:
+          la lista de rangos a escribir, para Sheet.batch_update.
+        """
+        rows = self._sheet.read(Hojas.Notas.value)
+        if not rows:
+            return []
+        headers = [str(h).strip().lower() for h in rows[0]]
+        padron = headers.index(PADRON_HEADER.lower())
+        fila_por_legajo = {
+            str(row[padron]): i
+            for i, row in enumerate(rows)
+            if i > 0 and padron < len(row) and row[padron]
+        }
+
+        data = []
+        for (tp_id, legajo), value in sorted(pending.items()):
+            try:
+                col = headers.index(tp_id.lower())
+                i = fila_por_legajo[legajo]
+            except (ValueError, KeyError):
+                logger.warning(f"no hay celda en Notas para {tp_id} de {legajo}")
+                continue
+            current = rows[i][col] if col < len(rows[i]) else ""
+            if current not in ("", value) and current not in RESULTADOS:
+                continue  # Ya tiene una nota.
+            if current != value:
+                cell = f"{Hojas.Notas.value}!{column_letter(col)}{i + 1}"
+                data.append({"range": cell, "values": [[value]]})
+        return data
+
+
+def column_letter(index: int) -> str:
+    """Devuelve el nombre de una columna a partir de su índice (0 es "A").
+    """
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
+
+
+def run(writer: NotasWriter):
+    """Bucle principal del daemon.
+    """
+    failures = 0
+    while True:
+        time.sleep(backoff(failures) if failures else FLUSH_INTERVAL)
+        try:
+            written = writer.flush()
+        except Exception as ex:
+            failures += 1
+            logger.error(f"falló la escritura en Notas: {ex}")
+        else:
+            failures = 0
+            if written:
+                metrics.incr("notas_written", written)
+        metrics.gauge("notas_pending", redis_conn.hlen(NOTAS_KEY))
+
+
+def backoff(failures: int) -> float:
+    """Devuelve el tiempo a esperar tras un número de fallos consecutivos.
+    """
+    delay = min(MAX_BACKOFF, FLUSH_INTERVAL * 2 ** failures)
+    return random.uniform(delay / 2, delay)
+
+
+def _field(tp_id: str, legajo: str) -> str:
+    return f"{tp_id}\t{legajo}"
+
+
+def _take_pending() -> Dict[Tuple[str, str], str]:
+    """Obtiene y borra, de manera atómica, los resultados pendientes.
+    """
+    with redis_conn.pipeline() as pipe:
+        pipe.hgetall(NOTAS_KEY)
+        pipe.delete(NOTAS_KEY)
+        fields, _ = pipe.execute()
+    pending = {}
+    for field, value in fields.items():
+        tp_id, legajo = field.decode("utf-8").split("\t", 1)
+        pending[tp_id, legajo] = value.decode("utf-8")
+    return pending
+
+
+def _restore_pending(pending: Dict[Tuple[str, str], str]):
+    with redis_conn.pipeline() as pipe:
+        for (tp_id, legajo), value in pending.items():
+            pipe.hsetnx(NOTAS_KEY, _field(tp_id, legajo), value)
+        pipe.execute()
+
+
+def main():
+    from google.oauth2.service_account import Credentials  # type: ignore
+
+    from config import load_config
+
+    cfg = load_config()
+    credentials = Credentials.from_service_account_file(
+        cfg.service_account_jsonfile,
+        scopes=["https://www.googleapis.com/auth/spreadsheets"],
+    )
+    api_endpoint = os.environ.get("CORRECTOR_SHEETS_API")
+    run(NotasWriter(GoogleSheet(cfg.spreadsheet_id, credentials, api_endpoint)))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
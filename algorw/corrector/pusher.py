@@ -0,0 +1,145 @@
+"""Push en segundo plano de los repositorios de entregas.
+
+Moss.flush() solo hace el commit local, y anota en Redis que el repositorio
+necesita un push (request_push). Este módulo, que uWSGI ejecuta como daemon
+(ver entregas.ini), espera unos segundos a que se acumulen más commits y hace
+un único push para todos ellos. Si el push falla, se reintenta con backoff
+exponencial; mientras tanto, los workers siguen corrigiendo.
+
+Como métrica se publica "push_lag_seconds": el tiempo transcurrido entre el
+commit más antiguo de un push y la finalización exitosa de ese push. Ese mismo
+tiempo, para cada commit, se registra como etapa "push" en la traza de la
+entrega correspondiente (ver algorw.common.traces).
+"""
+
+import json
+import logging
+import os
+import pathlib
+import random
+import subprocess
+import time
+
+from typing import Dict, List, Optional, Tuple
+
+from redis import Redis
+
+from ..common import metrics, traces
+
+
+PUSH_QUEUE = "entregas:push"
+PUSH_WINDOW = float(os.environ.get("CORRECTOR_PUSH_WINDOW", 5))
+PUSH_TIMEOUT = 120
+MAX_BACKOFF = 300
+
+redis_conn = Redis()
+logger = logging.getLogger(__name__)
+
+
+def request_push(repo_dir: pathlib.Path, *, trace_id: Optional[str] = None):
+    """Anota que el repositorio que contiene a repo_dir tiene commits sin enviar.
+    """
+    request = {"repo": str(repo_dir), "time": time.time(), "trace_id": trace_id}
+    redis_conn.rpush(PUSH_QUEUE, json.dumps(request))
+
+
+def run():
+    """Bucle principal del daemon.
+    """
+    # Para cada repositorio, hora del pedido más antiguo aún sin enviar, y
+    # las trazas (con la hora de su pedido) que esperan ese push.
+    pending: Dict[str, float] = {}
+    waiting: Dict[str, List[Tuple[str, float]]] = {}
+    failures = 0
+
+    while True:
+        if not pending:
+            _, request = redis_conn.blpop(PUSH_QUEUE)
+            _add_request(pending, waiting, request)
+
+        # Dar tiempo a que se acumulen más commits o, tras un error, esperar
+        # el backoff correspondiente antes de reintentar.
+        time.sleep(backoff(failures) if failures else PUSH_WINDOW)
+
+        for request in _drain_queue():
+            _add_request(pending, waiting, request)
+
+        for repo, oldest in list(pending.items()):
+            if push(repo):
+                del pending[repo]
+                now = time.time()
+                metrics.gauge("push_lag_seconds", now - oldest)
+                for trace_id, requested in waiting.pop(repo, []):
+                    traces.record(trace_id, "push", requested, now - requested)
+
+        failures = failures + 1 if pending else 0
+        metrics.gauge("push_pending_repos", len(pending))
+
+
+def push(repo: str) -> bool:
+    """Hace push de todas las ramas de un repositorio.
+
+    Returns:
+      True si el push fue exitoso.
+    """
+    try:
+        subprocess.run(
+            # ":" son las ramas en común con origin; HEAD, la actual, que no
+            # existe en origin si el repositorio es nuevo (ver shards.py).
+            ["git", "push", "--force-with-lease", "origin", ":", "HEAD"],
+            cwd=repo,
+            check=True,
+            timeout=PUSH_TIMEOUT,
+            capture_output=True,
+            encoding="utf-8",
+        )
+    except subprocess.CalledProcessError as ex:
+        logger.error(f"falló push de {repo}: {ex.stderr.strip()}")
+    except subprocess.TimeoutExpired:
+        logger.error(f"timeout en push de {repo}")
+    else:
+        return True
+
+    return False
+
+
+def backoff(failures: int) -> float:
+    """Devuelve el tiempo a esperar tras un número de fallos consecutivos.
+    """
+    delay = min(MAX_BACKOFF, PUSH_WINDOW * 2 ** failures)
+    return random.uniform(delay / 2, delay)
+
+
+def _drain_queue() -> List[bytes]:
+    with redis_conn.pipeline() as pipe:
+        pipe.lrange(PUSH_QUEUE, 0, -1)
+        pipe.delete(PUSH_QUEUE)
+        requests, _ = pipe.execute()
+    return requests
+
+
+def _add_request(
+    pending: Dict[str, float],
+    waiting: Dict[str, List[Tuple[str, float]]],
+    request: bytes,
+):
+    data = json.loads(request)
+    try:
+        repo = _toplevel(data["repo"])
+    except (subprocess.CalledProcessError, OSError) as ex:
+        logger.error(f"pedido de push inválido para {data['repo']}: {ex}")
+    else:
+        pending[repo] = min(pending.get(repo, data["time"]), data["time"])
+        if trace_id := data.get("trace_id"):
+            waiting.setdefault(repo, []).append((trace_id, data["time"]))
+
+
+def _toplevel(path: str) -> str:
+    return subprocess.check_output(
+        ["git", "rev-parse", "--show-toplevel"], cwd=path, encoding="utf-8"
+    ).strip()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    run()
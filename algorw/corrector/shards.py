@@ -0,0 +1,255 @@
+"""Repositorios de entregas divididos ("shards") por cuatrimestre o por TP.
+
+Con el tiempo, la historia y el índice del repositorio de entregas (DATA_DIR)
+crecen, y con ellos el costo de cada `git add`, `git commit` y `git push`, y de
+clonarlo. Con CORRECTOR_SHARDING, las entregas se guardan en un repositorio por
+cuatrimestre ("cuatri") o por cuatrimestre y TP ("tp"); sin esa variable, todo
+sigue en DATA_DIR.
+
+Cada shard es un repositorio en ROOT_DIR/<CORRECTOR_TPS>_<shard> (p.ej.
+algo2_entregas_2020_1, o algo2_entregas_2020_1_pila) con las mismas rutas que
+DATA_DIR (pila/2020_1/54321). Así, CorrectorTask.repo_relpath, los índices de
+commits y de similitud, y las URLs de cada entrega no cambian de formato:
+locate() indica en qué repositorio está cada ruta. Los parcialitos de un
+cuatrimestre van todos en un mismo shard (<cuatri>_parcialitos, con "tp").
+
+Los shards se crean al guardar su primera entrega (ensure), con un origin
+derivado del de DATA_DIR (algo2_entregas.git → algo2_entregas_2020_1.git); si
+el origin está en Github, se crea también el repositorio remoto (privado).
+
+Para dividir la historia existente de DATA_DIR en shards:
+
+    python -m algorw.corrector.shards migrate [--dry-run]
+"""
+
+import argparse
+import logging
+import os
+import pathlib
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from typing import Dict, List, Optional, Union
+
+from dotenv import load_dotenv
+
+
+__all__ = [
+    "DATA_DIR",
+    "ensure",
+    "locate",
+    "repo_dir",
+    "shard_name",
+    "web_url",
+]
+
+load_dotenv()
+
+ROOT_DIR = pathlib.Path(os.environ["CORRECTOR_ROOT"])
+DATA_DIR = ROOT_DIR / os.environ["CORRECTOR_TPS"]
+
+SHARDING = os.environ.get("CORRECTOR_SHARDING", "")
+SHARDING_MODES = {"", "cuatri", "tp"}
+
+CUATRI_REGEX = re.compile(r"^\d{4}_\d$")
+GITHUB_REGEX = re.compile(r"github\.com[:/]+(?P<name>[\w.-]+/[\w.-]+?)(?:\.git)?/?$")
+
+RelPath = Union[str, pathlib.PurePath]
+
+logger = logging.getLogger(__name__)
+
+
+def shard_name(relpath: RelPath) -> Optional[str]:
+    """Devuelve el shard de una ruta (p.ej. "pila/2020_1/54321"), o None.
+
+    La ruta debe incluir al menos el TP y el cuatrimestre (o "parcialitos" y
+    el cuatrimestre).
+    """
+    if SHARDING not in SHARDING_MODES:
+        raise ValueError(f"CORRECTOR_SHARDING inválido: {SHARDING!r}")
+    if not SHARDING:
+        return None
+    tp_id, cuatri = pathlib.PurePosixPath(relpath).parts[:2]
+    return cuatri if SHARDING == "cuatri" else f"{cuatri}_{tp_id}"
+
+
+def repo_dir(relpath: RelPath) -> pathlib.Path:
+    """Devuelve el directorio del repositorio que contiene una ruta.
+    """
+    shard = shard_name(relpath)
+    return DATA_DIR if shard is None else _shard_dir(shard)
+
+
+def locate(relpath: RelPath) -> pathlib.Path:
+    """Devuelve el directorio de una ruta (p.ej. el de una entrega).
+    """
+    return repo_dir(relpath) / relpath
+
+
+def ensure(relpath: RelPath) -> pathlib.Path:
+    """Como locate(), pero crea el shard si aún no existe.
+    """
+    shard = shard_name(relpath)
+    if shard is not None and not _shard_dir(shard).exists():
+        create(shard)
+    return locate(relpath)
+
+
+def create(shard: str):
+    """Crea el repositorio de un shard, con su origin.
+
+    Si otro proceso lo crea al mismo tiempo, se conserva el suyo.
+    """
+    dest = _shard_dir(shard)
+    tmp_dir = pathlib.Path(tempfile.mkdtemp(dir=ROOT_DIR, prefix=f".{dest.name}"))
+    _git(tmp_dir, "init", "-q")
+    _configure(tmp_dir, shard)
+    try:
+        tmp_dir.rename(dest)
+    except OSError:
+        shutil.rmtree(tmp_dir)
+        return
+    logger.info(f"creado el shard {dest}")
+    _create_remote(dest)
+
+
+def origin_url(shard: str) -> Optional[str]:
+    """Devuelve la URL del origin de un shard, derivada de la de DATA_DIR.
+    """
+    result = _git(DATA_DIR, "remote", "get-url", "origin", check=False)
+    if not (url := result.stdout.strip()):
+        return None
+    base, dot_git = (url[:-4], ".git") if url.endswith(".git") else (url, "")
+    return f"{base}_{shard}{dot_git}"
+
+
+def web_url(path: pathlib.Path) -> Optional[str]:
+    """Devuelve la URL en Github del repositorio que contiene path, si la hay.
+    """
+    url = _git(path, "remote", "get-url", "origin", check=False).stdout.strip()
+    if match := GITHUB_REGEX.search(url):
+        return f"https://github.com/{match['name']}"
+    return None
+
+
+def migrate(*, dry_run: bool = False) -> int:
+    """Divide la historia de DATA_DIR en shards (los existentes se omiten).
+
+    Cada shard se clona de DATA_DIR, y con `git filter-branch` se conservan
+    solo los commits y archivos de sus rutas. DATA_DIR no se modifica.
+    """
+    if not SHARDING:
+        print("CORRECTOR_SHARDING no está definida", file=sys.stderr)
+        return 1
+
+    prefixes: Dict[str, List[str]] = {}
+    for top in _ls_dirs(DATA_DIR, "HEAD"):
+        for cuatri in filter(CUATRI_REGEX.match, _ls_dirs(DATA_DIR, f"HEAD:{top}")):
+            prefix = f"{top}/{cuatri}"
+            prefixes.setdefault(shard_name(prefix), []).append(prefix)
+
+    for shard, paths in sorted(prefixes.items()):
+        dest = _shard_dir(shard)
+        print(f"{dest.name}: {', '.join(paths)}", file=sys.stderr)
+        if dest.exists():
+            print("  ya existe, se omite", file=sys.stderr)
+        elif not dry_run:
+            _split(shard, paths)
+
+    if not dry_run:
+        print(
+            "Para publicar cada shard: git push -u origin HEAD; y para los índices"
+            " de similitud: python -m algorw.corrector.similarity rebuild",
+            file=sys.stderr,
+        )
+    return 0
+
+
+def _split(shard: str, paths: List[str]):
+    dest = _shard_dir(shard)
+    tmp_dir = pathlib.Path(tempfile.mkdtemp(dir=ROOT_DIR, prefix=f".{dest.name}"))
+    subprocess.run(
+        ["git", "clone", "-q", "--no-local", "--single-branch", DATA_DIR, tmp_dir],
+        check=True,
+    )
+    # Se quitan del índice de cada commit los archivos fuera de `paths`.
+    pattern = "|".join(re.escape(p) for p in paths)
+    index_filter = (
+        "git ls-files -z"
+        f" | grep -zvE '^({pattern})/'"
+        " | xargs -0 -r git rm -q --cached --"
+    )
+    env = {**os.environ, "FILTER_BRANCH_SQUELCH_WARNING": "1"}
+    subprocess.run(
+        ["git", "filter-branch", "--index-filter", index_filter, "--prune-empty"],
+        cwd=tmp_dir,
+        env=env,
+        check=True,
+    )
+    _git(tmp_dir, "update-ref", "-d", "refs/original/refs/heads/" + _branch(tmp_dir))
+    _git(tmp_dir, "remote", "remove", "origin")
+    _configure(tmp_dir, shard)
+    _git(tmp_dir, "gc", "-q", "--prune=now")
+    tmp_dir.rename(dest)
+
+
+def _configure(repo: pathlib.Path, shard: str):
+    """Configura el origin y la identidad de Git de un shard, como en DATA_DIR.
+    """
+    if url := origin_url(shard):
+        _git(repo, "remote", "add", "origin", url)
+    for key in ("user.name", "user.email"):
+        if value := _git(DATA_DIR, "config", key, check=False).stdout.strip():
+            _git(repo, "config", key, value)
+
+
+def _create_remote(repo: pathlib.Path):
+    """Crea en Github el repositorio del origin (si está en Github).
+    """
+    url = _git(repo, "remote", "get-url", "origin", check=False).stdout.strip()
+    if not (match := GITHUB_REGEX.search(url)):
+        return
+    # Import costoso, y que requiere CORRECTOR_GH_TOKEN: solo al crear un shard.
+    from . import gh_client
+
+    try:
+        gh_client.ensure_repo(match["name"], private=True)
+    except Exception as ex:
+        # El push fallará (y se reintentará) hasta que exista el repositorio.
+        logger.error(f"no se pudo crear el repositorio {match['name']}: {ex}")
+
+
+def _shard_dir(shard: str) -> pathlib.Path:
+    return DATA_DIR.with_name(f"{DATA_DIR.name}_{shard}")
+
+
+def _ls_dirs(repo: pathlib.Path, tree: str) -> List[str]:
+    out = _git(repo, "ls-tree", "-d", "--name-only", tree).stdout
+    return [name for name in out.splitlines() if name]
+
+
+def _branch(repo: pathlib.Path) -> str:
+    return _git(repo, "symbolic-ref", "--short", "HEAD").stdout.strip()
+
+
+def _git(repo: pathlib.Path, *args, check: bool = True):
+    return subprocess.run(
+        ["git", *args], cwd=repo, check=check, capture_output=True, encoding="utf-8"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = subparsers.add_parser("migrate", help="dividir DATA_DIR")
+    migrate_parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    return migrate(dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
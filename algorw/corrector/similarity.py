@@ -0,0 +1,331 @@
+"""Índice de similitud de código entre entregas, incremental.
+
+Para detectar copias, en lugar de comparar todas las entregas de a pares al
+final del cuatrimestre, se calcula al guardar cada entrega (ver Moss.flush) un
+conjunto de huellas ("fingerprints") de su código C, y se lo compara contra un
+índice invertido de las huellas de las demás entregas del mismo TP y
+cuatrimestre. El costo de cada entrega es proporcional a su tamaño.
+
+Las huellas se obtienen por "winnowing" (Schleimer, Wilkerson y Aiken, 2003):
+el código se normaliza (sin comentarios ni directivas del preprocesador, y con
+identificadores, números y cadenas reemplazados por un marcador), se calcula un
+hash de cada secuencia de K tokens, y de cada ventana de W hashes consecutivos
+se conserva el mínimo. Así, toda coincidencia de al menos K + W - 1 tokens
+comparte al menos una huella. Las huellas del código base del TP (skel) no se
+cuentan, porque todas las entregas las comparten.
+
+El índice es una base SQLite en el directorio .git del repositorio de entregas,
+y los pares con muchas huellas en común se listan con:
+
+    python -m algorw.corrector.similarity report TP_ID CUATRI [--min 0.5]
+
+Para indexar entregas ya existentes (p.ej. de antes de este índice):
+
+    python -m algorw.corrector.similarity rebuild TP_ID CUATRI
+"""
+
+import argparse
+import collections
+import hashlib
+import os
+import pathlib
+import re
+import sqlite3
+import subprocess
+import sys
+
+from functools import lru_cache
+from typing import Deque, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set
+
+from . import shards, skel_cache
+
+
+__all__ = [
+    "SimilarityIndex",
+    "base_fingerprints",
+    "fingerprints",
+    "source_fingerprints",
+]
+
+INDEX_FILENAME = "entregas_similarity.sqlite3"
+
+K = 15  # Tokens por k-grama.
+W = 8  # Hashes por ventana.
+
+SOURCE_SUFFIXES = {".c", ".h"}
+
+# Los pares con menor proporción de huellas en común no se guardan.
+MIN_STORED_SCORE = 0.2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    bucket TEXT NOT NULL,
+    hash INTEGER NOT NULL,
+    entrega TEXT NOT NULL,
+    PRIMARY KEY (bucket, hash, entrega)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS fingerprints_entrega ON fingerprints (bucket, entrega);
+
+CREATE TABLE IF NOT EXISTS entregas (
+    bucket TEXT NOT NULL,
+    entrega TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (bucket, entrega)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS matches (
+    bucket TEXT NOT NULL,
+    a TEXT NOT NULL,
+    b TEXT NOT NULL,
+    shared INTEGER NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (bucket, a, b)
+) WITHOUT ROWID;
+"""
+
+C_KEYWORDS = set(
+    """
+    auto break case char const continue default do double else enum extern
+    float for goto if inline int long register restrict return short signed
+    sizeof static struct switch typedef union unsigned void volatile while
+    bool true false NULL
+    """.split()
+)
+
+TOKEN_REGEX = re.compile(
+    r"""
+      (?P<skip>//[^\n]*|/\*.*?\*/|^[ \t]*\#(?:\\\n|[^\n])*|\s+)
+    | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+    | (?P<ident>[A-Za-z_]\w*)
+    | (?P<number>\.?\d(?:[eEpP][+-]|[\w.])*)
+    | (?P<op>.)
+    """,
+    re.S | re.M | re.X,
+)
+
+
+class Match(NamedTuple):
+    a: str
+    b: str
+    shared: int
+    score: float
+
+
+def normalize(source: str) -> List[str]:
+    """Devuelve los tokens normalizados de un archivo de código C.
+    """
+    tokens = []
+    for match in TOKEN_REGEX.finditer(source):
+        kind, text = match.lastgroup, match.group()
+        if kind == "skip":
+            continue
+        elif kind == "ident":
+            tokens.append(text if text in C_KEYWORDS else "I")
+        elif kind == "number":
+            tokens.append("N")
+        elif kind == "string":
+            tokens.append("S")
+        else:
+            tokens.append(text)
+    return tokens
+
+
+def fingerprints(source: str, k: int = K, w: int = W) -> Set[int]:
+    """Calcula las huellas de un archivo de código C por winnowing.
+    """
+    tokens = normalize(source)
+    hashes = [_hash(tokens[i:end]) for i, end in enumerate(range(k, len(tokens) + 1))]
+    if len(hashes) <= w:
+        return {min(hashes)} if hashes else set()
+
+    selected = set()
+    last = -1
+    # Posiciones candidatas a mínimo de la ventana actual, con hashes
+    # crecientes: la primera es el mínimo (el de más a la derecha, si hay
+    # repetidos, para no repetir posiciones).
+    window: Deque[int] = collections.deque()
+    for i, h in enumerate(hashes):
+        while window and hashes[window[-1]] >= h:
+            window.pop()
+        window.append(i)
+        if window[0] <= i - w:
+            window.popleft()
+        if i >= w - 1 and window[0] != last:
+            last = window[0]
+            selected.add(hashes[last])
+    return selected
+
+
+def source_fingerprints(files: Dict[str, bytes]) -> Set[int]:
+    """Calcula las huellas de los archivos de código de una entrega.
+    """
+    result: Set[int] = set()
+    for name, contents in files.items():
+        if pathlib.PurePath(name).suffix in SOURCE_SUFFIXES:
+            result |= fingerprints(contents.decode("utf-8", errors="replace"))
+    return result
+
+
+def base_fingerprints(skel_dir: Optional[pathlib.Path]) -> FrozenSet[int]:
+    """Devuelve las huellas del código base de un TP (vacío si no existe).
+    """
+    if skel_dir is None or not skel_dir.is_dir():
+        return frozenset()
+    return _base_fingerprints(skel_dir, skel_cache.skel_hash(skel_dir))
+
+
+@lru_cache(maxsize=32)
+def _base_fingerprints(skel_dir: pathlib.Path, skel_hash: str) -> FrozenSet[int]:
+    return frozenset(source_fingerprints(dir_sources(skel_dir)))
+
+
+def dir_sources(directory: pathlib.Path) -> Dict[str, bytes]:
+    """Devuelve los archivos de código de un directorio.
+    """
+    return {
+        path.relative_to(directory).as_posix(): path.read_bytes()
+        for path in sorted(directory.rglob("*"))
+        if path.suffix in SOURCE_SUFFIXES and path.is_file()
+    }
+
+
+class SimilarityIndex:
+    """Índice invertido de huellas, por TP y cuatrimestre.
+    """
+
+    def __init__(self, repo_dir: pathlib.Path):
+        git_dir = subprocess.run(
+            ["git", "rev-parse", "--absolute-git-dir"],
+            cwd=repo_dir,
+            check=True,
+            capture_output=True,
+            encoding="utf-8",
+        ).stdout.strip()
+        self._db = sqlite3.connect(pathlib.Path(git_dir) / INDEX_FILENAME, timeout=30)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add(self, relpath: str, prints: Set[int], base: Set[int] = frozenset()):
+        """Indexa (o reindexa) una entrega, y registra sus coincidencias.
+
+        Args:
+          relpath: ruta de la entrega en el repositorio (p.ej. pila/2020_1/54321);
+              se compara solo con las entregas de su mismo directorio padre.
+          prints: las huellas de la entrega.
+          base: huellas a ignorar (las del código base del TP).
+        """
+        bucket, entrega = _split(relpath)
+        prints = set(prints) - set(base)
+
+        with self._db:
+            self._remove(bucket, entrega)
+            self._db.execute(
+                "INSERT INTO entregas (bucket, entrega, size) VALUES (?, ?, ?)",
+                (bucket, entrega, len(prints)),
+            )
+            self._db.executemany(
+                "INSERT INTO fingerprints (bucket, hash, entrega) VALUES (?, ?, ?)",
+                ((bucket, h, entrega) for h in prints),
+            )
+            if prints:
+                self._record_matches(bucket, entrega, len(prints))
+
+    def matches(self, bucket: str, min_score: float = 0.5) -> List[Match]:
+        """Devuelve los pares de entregas de un TP y cuatrimestre más parecidos.
+        """
+        rows = self._db.execute(
+            "SELECT a, b, shared, score FROM matches"
+            " WHERE bucket = ? AND score >= ? ORDER BY score DESC, shared DESC",
+            (bucket, min_score),
+        )
+        return [Match(*row) for row in rows]
+
+    def _record_matches(self, bucket: str, entrega: str, size: int):
+        # Por cada huella se consulta el índice (bucket, hash): el costo es
+        # proporcional a la cantidad de huellas de esta entrega.
+        rows = self._db.execute(
+            """
+            SELECT other.entrega, COUNT(*), e.size
+              FROM fingerprints AS mine
+              JOIN fingerprints AS other
+                ON other.bucket = mine.bucket AND other.hash = mine.hash
+              JOIN entregas AS e
+                ON e.bucket = other.bucket AND e.entrega = other.entrega
+             WHERE mine.bucket = ? AND mine.entrega = ? AND other.entrega != ?
+             GROUP BY other.entrega
+            """,
+            (bucket, entrega, entrega),
+        ).fetchall()
+        for other, shared, other_size in rows:
+            score = shared / max(1, min(size, other_size))
+            if score >= MIN_STORED_SCORE:
+                a, b = sorted((entrega, other))
+                self._db.execute(
+                    "INSERT INTO matches (bucket, a, b, shared, score)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (bucket, a, b, shared, score),
+                )
+
+    def _remove(self, bucket: str, entrega: str):
+        params = (bucket, entrega)
+        for table in ("fingerprints", "entregas"):
+            self._db.execute(
+                f"DELETE FROM {table} WHERE bucket = ? AND entrega = ?", params
+            )
+        self._db.execute("DELETE FROM matches WHERE bucket = ? AND ? IN (a, b)", params)
+
+
+def _split(relpath: str):
+    path = pathlib.PurePosixPath(relpath)
+    return path.parent.as_posix(), path.name
+
+
+def _hash(tokens: Iterable[str]) -> int:
+    digest = hashlib.blake2b("\0".join(tokens).encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "big", signed=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command in ("report", "rebuild"):
+        subparser = subparsers.add_parser(command)
+        subparser.add_argument("tp_id")
+        subparser.add_argument("cuatri")
+    subparsers.choices["report"].add_argument("--min", type=float, default=0.5)
+    args = parser.parse_args()
+
+    bucket = f"{args.tp_id.lower()}/{args.cuatri}"
+    data_dir = shards.repo_dir(bucket)
+
+    with SimilarityIndex(data_dir) as index:
+        if args.command == "rebuild":
+            skel_dir = (
+                pathlib.Path(os.environ["CORRECTOR_ROOT"])
+                / os.environ["CORRECTOR_SKEL"]
+                / args.tp_id.lower()
+            )
+            base = base_fingerprints(skel_dir)
+            entregas = sorted(p for p in (data_dir / bucket).iterdir() if p.is_dir())
+            for entrega_dir in entregas:
+                prints = source_fingerprints(dir_sources(entrega_dir))
+                index.add(f"{bucket}/{entrega_dir.name}", prints, base)
+            print(f"{len(entregas)} entregas indexadas", file=sys.stderr)
+            return 0
+
+        for match in index.matches(bucket, args.min):
+            print(f"{match.score:6.1%} {match.shared:6d}  {match.a}  {match.b}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""Caché de la compilación de la base (skel) de cada TP.
+
+Cada entrega incluye en el archivo TAR los mismos fuentes de skel/ (pruebas de
+la cátedra, headers, auxiliares), y el worker los compilaba cada vez. Con esta
+caché, los .c de la base se compilan una sola vez por versión de la base y del
+compilador, y los objetos resultantes se agregan al TAR en skel/.build/, de
+modo que el worker solo necesita compilar los archivos de la entrega.
+
+La clave de la caché es el hash del contenido de SKEL_DIR/<tp_id> junto con la
+versión del compilador y los flags (SKEL_CFLAGS). Si la base no tiene archivos
+.c, o no compila por sí sola, no se agrega nada al TAR (y el worker la compila
+como siempre). El archivo skel/.build/KEY permite al worker verificar que los
+objetos correspondan a su compilador.
+
+Para medir el tiempo de compilación de la base, con y sin caché:
+
+    python -m algorw.corrector.skel_cache bench TP_ID [--runs N]
+"""
+
+import argparse
+import hashlib
+import os
+import pathlib
+import shlex
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+
+__all__ = [
+    "add_to_tar",
+    "build",
+]
+
+ROOT_DIR = pathlib.Path(os.environ["CORRECTOR_ROOT"])
+CACHE_DIR = ROOT_DIR / "cache" / "skel"
+
+CC = os.environ.get("CORRECTOR_SKEL_CC", "cc")
+SKEL_CFLAGS = shlex.split(
+    os.environ.get("CORRECTOR_SKEL_CFLAGS", "-g -std=c99 -Wall -Wformat=2")
+)
+
+BUILD_DIR = ".build"
+KEY_FILE = "KEY"
+FAILED_MARK = "FAILED"
+
+# Hash de cada skel_dir, invalidado si cambia el mtime o el tamaño de algún archivo.
+_hash_lock = threading.Lock()
+_hashes: Dict[pathlib.Path, Tuple[Tuple, str]] = {}
+
+
+def add_to_tar(tar: tarfile.TarFile, skel_dir: pathlib.Path):
+    """Agrega al TAR los objetos compilados de la base, en skel/.build/.
+    """
+    if (build_dir := build(skel_dir)) is None:
+        return
+    for path in sorted(build_dir.iterdir()):
+        tar.add(path, f"skel/{BUILD_DIR}/{path.name}")
+
+
+def build(skel_dir: pathlib.Path, *, force: bool = False) -> Optional[pathlib.Path]:
+    """Compila la base de un TP, o la obtiene de la caché.
+
+    Returns:
+      el directorio con los objetos compilados, o None si la base no tiene
+      archivos .c o no compila.
+    """
+    sources = _sources(skel_dir)
+    if not sources:
+        return None
+
+    key = cache_key(skel_dir)
+    cache_dir = CACHE_DIR / key
+    if cache_dir.exists() and not force:
+        return None if (cache_dir / FAILED_MARK).exists() else cache_dir
+
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_dir = pathlib.Path(tempfile.mkdtemp(dir=CACHE_DIR, prefix=".tmp"))
+    ok = compile_sources(skel_dir, sources, tmp_dir)
+    if ok:
+        (tmp_dir / KEY_FILE).write_text(f"{key}\n")
+    else:
+        # Se recuerda el fallo para no volver a intentarlo en cada entrega.
+        for path in tmp_dir.iterdir():
+            path.unlink()
+        (tmp_dir / FAILED_MARK).touch()
+
+    if force:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    try:
+        tmp_dir.rename(cache_dir)
+    except OSError:
+        # Otro worker compiló la misma base al mismo tiempo.
+        shutil.rmtree(tmp_dir)
+
+    return cache_dir if ok else None
+
+
+def compile_sources(
+    skel_dir: pathlib.Path, sources: List[pathlib.Path], dest: pathlib.Path
+) -> bool:
+    """Compila cada fuente a un objeto en `dest`.
+    """
+    for source in sources:
+        name = source.relative_to(skel_dir).with_suffix(".o").as_posix()
+        obj = dest / name.replace("/", "__")
+        cmd = [CC, *SKEL_CFLAGS, "-I", str(skel_dir), "-c", str(source), "-o", str(obj)]
+        result = subprocess.run(cmd, capture_output=True, encoding="utf-8")
+        if result.returncode != 0:
+            print(f"skel_cache: no compila {source}: {result.stderr}", file=sys.stderr)
+            return False
+    return True
+
+
+def cache_key(skel_dir: pathlib.Path) -> str:
+    digest = hashlib.sha256()
+    digest.update(skel_hash(skel_dir).encode("ascii"))
+    digest.update(toolchain_version().encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+def skel_hash(skel_dir: pathlib.Path) -> str:
+    """Devuelve un hash del contenido de la base (rutas y contenido de archivos).
+    """
+    files = sorted(
+        path
+        for path in skel_dir.rglob("*")
+        if path.is_file() and BUILD_DIR not in path.relative_to(skel_dir).parts
+    )
+    signature = tuple((str(p), p.stat().st_mtime_ns, p.stat().st_size) for p in files)
+
+    with _hash_lock:
+        if (cached := _hashes.get(skel_dir)) is not None and cached[0] == signature:
+            return cached[1]
+
+    digest = hashlib.sha256()
+    for path in files:
+        digest.update(path.relative_to(skel_dir).as_posix().encode("utf-8") + b"\0")
+        digest.update(path.read_bytes())
+        digest.update(b"\0")
+    value = digest.hexdigest()
+
+    with _hash_lock:
+        _hashes[skel_dir] = (signature, value)
+    return value
+
+
+@lru_cache(maxsize=None)
+def toolchain_version() -> str:
+    """Devuelve la versión del compilador junto con los flags de compilación.
+    """
+    result = subprocess.run([CC, "--version"], capture_output=True, encoding="utf-8")
+    version = result.stdout.split("\n", 1)[0]
+    return f"{version} {shlex.join(SKEL_CFLAGS)}"
+
+
+def _sources(skel_dir: pathlib.Path) -> List[pathlib.Path]:
+    return sorted(
+        path
+        for path in skel_dir.rglob("*.c")
+        if BUILD_DIR not in path.relative_to(skel_dir).parts
+    )
+
+
+def bench(tp_id: str, runs: int):
+    """Compara el tiempo de compilar la base contra el de obtenerla de la caché.
+    """
+    skel_dir = ROOT_DIR / os.environ["CORRECTOR_SKEL"] / tp_id
+    sources = _sources(skel_dir)
+    if not sources:
+        print(f"{skel_dir}: no hay archivos .c", file=sys.stderr)
+        return 1
+
+    uncached, cached = [], []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as tmp:
+            start = time.perf_counter()
+            compile_sources(skel_dir, sources, pathlib.Path(tmp))
+            uncached.append(time.perf_counter() - start)
+
+    build(skel_dir)
+    for _ in range(runs):
+        _hashes.clear()
+        start = time.perf_counter()
+        build(skel_dir)
+        cached.append(time.perf_counter() - start)
+
+    print(f"{tp_id}: {len(sources)} archivos .c, {runs} ejecuciones")
+    print(f"  sin caché: {statistics.median(uncached) * 1000:8.1f} ms (mediana)")
+    print(f"  con caché: {statistics.median(cached) * 1000:8.1f} ms (mediana)")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Caché de compilación de skel/")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench_parser = subparsers.add_parser("bench", help=bench.__doc__.strip())
+    bench_parser.add_argument("tp_id")
+    bench_parser.add_argument("--runs", type=int, default=5)
+    build_parser = subparsers.add_parser("build", help="compilar la base de un TP")
+    build_parser.add_argument("tp_id")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        return bench(args.tp_id.lower(), args.runs)
+
+    skel_dir = ROOT_DIR / os.environ["CORRECTOR_SKEL"] / args.tp_id.lower()
+    print(build(skel_dir, force=True) or "la base no compila")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
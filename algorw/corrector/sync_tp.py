@@ -0,0 +1,208 @@
+"""Sincronización masiva de las entregas de un TP con los repositorios de alumnes.
+
+Uso:
+
+    python -m algorw.corrector.sync_tp [--cuatri 2020_1] [--jobs 4] [--all] TP_ID
+
+Para cada entrega en DATA_DIR/<TP_ID>/<CUATRI>, se busca su repositorio con
+AluRepo, se lo crea si no existe, y se sincroniza la entrega en la rama del TP.
+Por omisión solo se sincronizan las entregas aceptadas ("Todo OK").
+
+Las entregas sincronizadas se anotan en un archivo de estado, de manera que si
+el proceso se interrumpe, al volver a ejecutarlo se continúa donde se dejó. Las
+que fallan se anotan con su error, y se reintentan en la próxima ejecución.
+"""
+
+import argparse
+import json
+import pathlib
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Set, Tuple
+
+import git  # type: ignore
+import requests
+
+from github import GithubException
+
+from config import load_config
+
+from ..common.resilience import CircuitOpenError
+from . import gh_client, shards
+from .alu_repos import ROOT_DIR, AluRepo
+from .corrector import TODO_OK_REGEX
+
+
+SKEL_REPO = "algorw-alu/algo2_tps"
+STATE_DIR = ROOT_DIR / "state"
+
+# Errores que hacen fallar una entrega, pero no el resto de la sincronización.
+SYNC_ERRORS = (
+    CircuitOpenError,
+    GithubException,
+    git.GitCommandError,
+    requests.RequestException,
+    OSError,
+    ValueError,
+)
+
+
+class SyncState:
+    """Entregas ya sincronizadas (y fallidas), persistidas en un archivo JSON.
+    """
+
+    def __init__(self, path: pathlib.Path):
+        self._path = path
+        self._lock = threading.Lock()
+        try:
+            state = json.loads(path.read_text())
+        except FileNotFoundError:
+            state = {}
+        self._done: Set[str] = set(state.get("done", []))
+        self._failed: Dict[str, str] = state.get("failed", {})
+
+    def __contains__(self, entrega: str) -> bool:
+        return entrega in self._done
+
+    def add(self, entrega: str):
+        with self._lock:
+            self._done.add(entrega)
+            self._failed.pop(entrega, None)
+            self._save()
+
+    def fail(self, entrega: str, error: str):
+        """Anota una entrega que no se pudo sincronizar (se reintenta luego).
+        """
+        with self._lock:
+            self._failed[entrega] = error
+            self._save()
+
+    def _save(self):
+        tmp_path = self._path.with_suffix(".tmp")
+        state = {"done": sorted(self._done), "failed": self._failed}
+        tmp_path.write_text(json.dumps(state, sort_keys=True))
+        tmp_path.replace(self._path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("tp_id", help="identificador del TP, p.ej. hash")
+    parser.add_argument("--cuatri", help="cuatrimestre (por omisión, el actual)")
+    parser.add_argument("--jobs", type=int, default=4, help="sincronizar en paralelo")
+    parser.add_argument("--all", action="store_true", help="incluir no aceptadas")
+    parser.add_argument("--state", type=pathlib.Path, help="archivo de estado")
+    args = parser.parse_args()
+
+    tp_id = args.tp_id.lower()
+    cuatri = args.cuatri or load_config().cuatri
+    state_path = args.state or STATE_DIR / f"sync_{tp_id}_{cuatri}.json"
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    state = SyncState(state_path)
+
+    entregas = find_entregas(shards.locate(f"{tp_id}/{cuatri}"), include_all=args.all)
+    pending = [
+        (entrega_dir, alu_repo)
+        for entrega_dir, alu_repo in resolve_repos(entregas, tp_id)
+        if entrega_dir.name not in state
+    ]
+    skipped = len(entregas) - len(pending)
+
+    print(f"{len(pending)} a sincronizar, {skipped} omitidas", file=sys.stderr)
+    failures = sync_all(pending, tp_id, state, jobs=args.jobs)
+
+    for repo_full, error in failures:
+        print(f"falló {repo_full}: {error}", file=sys.stderr)
+
+    return 1 if failures else 0
+
+
+def sync_all(
+    pending: List[Tuple[pathlib.Path, AluRepo]],
+    tp_id: str,
+    state: SyncState,
+    *,
+    jobs: int = 4,
+) -> List[Tuple[str, str]]:
+    """Sincroniza las entregas en paralelo, y anota cada resultado en `state`.
+
+    Returns:
+      la lista de fallas, como pares (repositorio, error).
+    """
+    failures: List[Tuple[str, str]] = []
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(sync_one, *e, tp_id): e for e in pending}
+        for i, future in enumerate(as_completed(futures), 1):
+            entrega_dir, alu_repo = futures[future]
+            try:
+                future.result()
+            except SYNC_ERRORS as ex:
+                failures.append((alu_repo.repo_full, str(ex)))
+                state.fail(entrega_dir.name, str(ex))
+                status = f"ERROR: {ex}"
+            else:
+                state.add(entrega_dir.name)
+                status = "ok"
+            progress = f"[{i}/{len(pending)}]"
+            print(f"{progress} {alu_repo.repo_full}: {status}", file=sys.stderr)
+    return failures
+
+
+def find_entregas(base_dir: pathlib.Path, *, include_all: bool) -> List[pathlib.Path]:
+    """Devuelve los directorios de entregas de un TP y cuatrimestre.
+    """
+    entregas = []
+    for entrega_dir in sorted(base_dir.iterdir()):
+        readme = entrega_dir / "README.md"
+        if include_all or (
+            readme.exists() and TODO_OK_REGEX.search(readme.read_text())
+        ):
+            entregas.append(entrega_dir)
+    return entregas
+
+
+def resolve_repos(entregas: List[pathlib.Path], tp_id: str):
+    """Obtiene el AluRepo de cada entrega (las entregas sin repositorio se omiten).
+
+    Los repositorios se obtienen todos juntos del índice por legajo (ver
+    AluRepo.from_tp), en lugar de consultarlo una vez por entrega.
+    """
+    by_legajo: Dict[str, AluRepo] = {}
+    for alu_repo in AluRepo.from_tp(tp_id):
+        by_legajo.update(dict.fromkeys(alu_repo.legajos, alu_repo))
+
+    for entrega_dir in entregas:
+        legajos = entrega_dir.name.split("_")
+        found = [by_legajo[x] for x in legajos if x in by_legajo]
+        repos = {alu_repo.repo_full: alu_repo for alu_repo in found}
+        if len(repos) == 1:
+            yield entrega_dir, repos.popitem()[1]
+        else:
+            problem = (
+                f"múltiples repos posibles: {set(repos)}"
+                if repos
+                else "ningún legajo con repositorio"
+            )
+            print(f"{entrega_dir.name}: sin repositorio ({problem})", file=sys.stderr)
+
+
+def sync_one(entrega_dir: pathlib.Path, alu_repo: AluRepo, tp_id: str):
+    """Sincroniza una entrega, esperando si se agotó el presupuesto de la API.
+    """
+    while True:
+        try:
+            gh_client.check_budget(low_priority=True)
+            alu_repo.ensure_exists(skel_repo=SKEL_REPO)
+            alu_repo.sync(entrega_dir, tp_id, low_priority=True)
+        except gh_client.RateBudgetExceeded as ex:
+            delay = max(0, ex.reset_time - time.time()) + 1
+            print(f"{ex}; esperando {delay:.0f} s", file=sys.stderr)
+            time.sleep(delay)
+        else:
+            return
+
+
+if __name__ == "__main__":
+    sys.exit(main())
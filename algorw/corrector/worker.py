@@ -0,0 +1,322 @@
+"""Ejecución del worker con límites de tiempo, memoria y tamaño de salida.
+
+El worker es un binario externo (WORKER_BIN) que compila y corre el código
+de les alumnes, y por tanto no se puede confiar en que termine ni en que su
+salida tenga un tamaño razonable. Esta clase:
+
+  - lee la salida a medida que se produce, y conserva en memoria solo el
+    principio y el final (OUTPUT_HEAD y OUTPUT_TAIL bytes);
+
+  - opcionalmente, guarda la salida completa (hasta FULL_OUTPUT_LIMIT bytes)
+    en un archivo comprimido, y la pasa a medida que llega a una función
+    (on_output);
+
+  - termina el grupo de procesos del worker si supera WORKER_TIMEOUT segundos
+    de ejecución, o WORKER_MAX_RSS MiB de memoria residente.
+
+Como iniciar el worker (y su sandbox) tiene un costo fijo que, para los TPs
+chicos, es buena parte del tiempo de corrección, WorkerPool mantiene procesos
+ya iniciados, bloqueados a la espera de su entrada.
+"""
+
+import collections
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from typing import BinaryIO, Callable, Deque, List, NamedTuple, Optional, Tuple
+
+
+__all__ = [
+    "OutputBuffer",
+    "WorkerPool",
+    "WorkerProcess",
+    "WorkerResult",
+]
+
+WORKER_TIMEOUT = float(os.environ.get("CORRECTOR_WORKER_TIMEOUT", 300))
+WORKER_MAX_RSS = int(os.environ.get("CORRECTOR_WORKER_MAX_RSS", 1024)) << 20
+WORKER_POOL_SIZE = int(os.environ.get("CORRECTOR_POOL_SIZE", 0))
+
+# Los procesos del pool que no se usaron en este tiempo se reemplazan (p.ej.
+# para que tomen una nueva versión del binario).
+POOL_MAX_IDLE = 600
+
+OUTPUT_HEAD = 64 * 1024
+OUTPUT_TAIL = 64 * 1024
+FULL_OUTPUT_LIMIT = 64 << 20
+
+READ_SIZE = 64 * 1024
+WATCHDOG_INTERVAL = 0.5
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class WorkerResult(NamedTuple):
+    output: str
+    returncode: int
+    killed: Optional[str] = None  # Motivo, si se terminó el proceso por un límite.
+
+
+class OutputBuffer:
+    """Buffer de tamaño acotado que conserva el principio y el final de la salida.
+    """
+
+    def __init__(self, head: int = OUTPUT_HEAD, tail: int = OUTPUT_TAIL):
+        self._head_size = head
+        self._tail_size = tail
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._elided = 0
+
+    def write(self, data: bytes):
+        room = self._head_size - len(self._head)
+        if room > 0:
+            self._head += data[:room]
+            data = data[room:]
+
+        self._tail += data
+        if (excess := len(self._tail) - self._tail_size) > 0:
+            del self._tail[:excess]
+            self._elided += excess
+
+    def getvalue(self) -> str:
+        head = self._head.decode("utf-8", errors="replace")
+        tail = self._tail.decode("utf-8", errors="replace")
+        if self._elided:
+            head += f"\n\n[… se omitieron {self._elided} bytes de salida …]\n\n"
+        return head + tail
+
+
+class WorkerProcess:
+    """Proceso worker con captura de salida acotada y límites de recursos.
+
+    Uso:
+
+        with WorkerProcess([WORKER_BIN], output_log=fileobj) as worker:
+            escribir_entrada(worker.stdin)
+            result = worker.wait()
+    """
+
+    def __init__(
+        self,
+        args: List,
+        *,
+        process: subprocess.Popen = None,
+        output_log: BinaryIO = None,
+        on_output: Callable[[bytes], None] = None,
+        timeout: float = WORKER_TIMEOUT,
+        max_rss: int = WORKER_MAX_RSS,
+    ):
+        self._timeout = timeout
+        self._max_rss = max_rss
+        self._output_log = output_log
+        self._on_output = on_output
+        self._logged = 0
+        self._buffer = OutputBuffer()
+        self._killed: Optional[str] = None
+        self._done = threading.Event()
+
+        # Si no se recibe un proceso ya iniciado (ver WorkerPool), se inicia.
+        self._proc = process or spawn(args)
+        self._started = time.monotonic()
+        self._reader = threading.Thread(target=self._read_output, daemon=True)
+        self._watchdog = threading.Thread(target=self._enforce_limits, daemon=True)
+        self._reader.start()
+        self._watchdog.start()
+
+    @property
+    def stdin(self) -> BinaryIO:
+        return self._proc.stdin
+
+    def wait(self) -> WorkerResult:
+        """Espera a que termine el worker, y devuelve su salida.
+        """
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+        # El watchdog se encarga de terminar el proceso al vencer el tiempo; la
+        # salida termina cuando se cierran todas las copias del pipe.
+        self._reader.join()
+        returncode = self._proc.wait()
+        self._done.set()
+
+        if self._output_log:
+            self._output_log.close()
+
+        return WorkerResult(self._buffer.getvalue(), returncode, self._killed)
+
+    def kill(self, reason: str = None):
+        """Termina el worker y todos sus procesos hijos.
+        """
+        if reason and self._killed is None:
+            self._killed = reason
+        try:
+            os.killpg(self._proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if not self._done.is_set():
+            self.kill()
+            self.wait()
+
+    def _read_output(self):
+        fd = self._proc.stdout.fileno()
+        while data := os.read(fd, READ_SIZE):
+            self._buffer.write(data)
+            self._log(data)
+            if self._on_output:
+                self._publish(data)
+        self._proc.stdout.close()
+
+    def _publish(self, data: bytes):
+        try:
+            self._on_output(data)
+        except Exception as ex:
+            # Si no se puede publicar la salida (p.ej. falla Redis), se la sigue
+            # leyendo igual: si no, el worker se bloquearía con el pipe lleno.
+            print(f"no se pudo publicar la salida del worker: {ex}", file=sys.stderr)
+            self._on_output = None
+
+    def _log(self, data: bytes):
+        if self._output_log is None or self._logged >= FULL_OUTPUT_LIMIT:
+            return
+        data = data[: FULL_OUTPUT_LIMIT - self._logged]
+        self._output_log.write(data)
+        self._logged += len(data)
+        if self._logged >= FULL_OUTPUT_LIMIT:
+            self._output_log.write(b"\n[salida truncada]\n")
+
+    def _enforce_limits(self):
+        while not self._done.wait(WATCHDOG_INTERVAL):
+            if time.monotonic() - self._started > self._timeout:
+                self.kill(f"se superó el límite de tiempo ({self._timeout:.0f} s)")
+            elif (rss := session_rss(self._proc.pid)) > self._max_rss:
+                self.kill(f"se superó el límite de memoria ({rss >> 20} MiB)")
+            else:
+                continue
+            break
+
+
+class WorkerPool:
+    """Pool de procesos worker iniciados de antemano.
+
+    Cada proceso del pool queda bloqueado leyendo su entrada; start() entrega
+    uno de inmediato (o inicia uno nuevo si no hay), y un hilo en segundo
+    plano repone el pool hasta `size` procesos.
+
+    El pool debe vivir más que un trabajo; con rq, eso requiere SimpleWorker
+    (el Worker por omisión ejecuta cada trabajo en un proceso nuevo).
+    """
+
+    def __init__(self, args: List, size: int = WORKER_POOL_SIZE):
+        self._args = args
+        self._size = size
+        self._idle: Deque[Tuple[float, subprocess.Popen]] = collections.deque()
+        self._lock = threading.Lock()
+        self._refill = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._replenish, daemon=True)
+        self._thread.start()
+        self._refill.set()
+
+    def start(self, **kwargs) -> WorkerProcess:
+        """Devuelve un WorkerProcess con un proceso del pool.
+
+        Los argumentos se pasan a WorkerProcess (p.ej. output_log, on_output).
+        """
+        process = self._take()
+        self._refill.set()
+        return WorkerProcess(self._args, process=process, **kwargs)
+
+    def close(self):
+        """Termina los procesos que aún no se usaron.
+        """
+        self._closed = True
+        self._refill.set()
+        with self._lock:
+            while self._idle:
+                _, proc = self._idle.popleft()
+                discard(proc)
+
+    def _take(self) -> Optional[subprocess.Popen]:
+        with self._lock:
+            while self._idle:
+                spawned, proc = self._idle.popleft()
+                if proc.poll() is None and time.monotonic() - spawned < POOL_MAX_IDLE:
+                    return proc
+                discard(proc)
+        return None
+
+    def _replenish(self):
+        while not self._closed:
+            self._refill.wait(POOL_MAX_IDLE / 2)
+            self._refill.clear()
+            now = time.monotonic()
+            with self._lock:
+                stale = [
+                    entry
+                    for entry in self._idle
+                    if entry[1].poll() is not None or now - entry[0] >= POOL_MAX_IDLE
+                ]
+                for entry in stale:
+                    self._idle.remove(entry)
+                missing = self._size - len(self._idle)
+            for _, proc in stale:
+                discard(proc)
+            for _ in range(missing):
+                if self._closed:
+                    break
+                proc = spawn(self._args)
+                with self._lock:
+                    self._idle.append((time.monotonic(), proc))
+
+
+def spawn(args: List) -> subprocess.Popen:
+    # Con una nueva sesión, se pueden terminar también los procesos hijos.
+    return subprocess.Popen(
+        args,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        start_new_session=True,
+    )
+
+
+def discard(proc: subprocess.Popen):
+    """Termina un proceso del pool que no se llegó a usar.
+    """
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    proc.stdin.close()
+    proc.stdout.close()
+    proc.wait()
+
+
+def session_rss(sid: int) -> int:
+    """Devuelve la memoria residente total (en bytes) de una sesión de procesos.
+    """
+    total = 0
+    for entry in os.scandir("/proc"):
+        if not entry.name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry.name}/stat") as stat_file:
+                # El campo 2, el nombre del programa, puede contener espacios.
+                fields = stat_file.read().rsplit(")", 1)[1].split()
+            if int(fields[3]) == sid:
+                with open(f"/proc/{entry.name}/statm") as statm_file:
+                    total += int(statm_file.read().split()[1]) * PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
@@ -3,10 +3,10 @@ import threading
 from dataclasses import dataclass
 from typing import Dict, List
 
-from googleapiclient import discovery  # type: ignore
+from .common.resilience import TIMEOUTS, breaker
 
 
-__all__ = ["Config", "PullDB"]
+__all__ = ["Config", "PullDB", "build_service"]
 
 
 @dataclass
@@ -44,19 +44,22 @@ class PullDB:
 
         Si ya habían sido descargadas, se remplazan los datos anteriores con los nuevos.
         """
-        service = discovery.build("sheets", "v4", credentials=self._cfg.credentials)
+        result = breaker("sheets").call(self._fetch)
+        sheets = parse_sheets(result["valueRanges"])
+        new_data = self.parse_sheets(sheets)
+        if new_data is not None:
+            with self._lock:
+                self.__data = new_data
+
+    def _fetch(self):
+        service = build_service(self._cfg.credentials)
         spreadsheets = service.spreadsheets()
         query = spreadsheets.values().batchGet(
             spreadsheetId=self._cfg.spreadsheet_id,
             ranges=self._cfg.sheet_list,
             valueRenderOption="UNFORMATTED_VALUE",
         )
-        result = query.execute()
-        sheets = parse_sheets(result["valueRanges"])
-        new_data = self.parse_sheets(sheets)
-        if new_data is not None:
-            with self._lock:
-                self.__data = new_data
+        return query.execute()
 
     def parse_sheets(self, sheet_dict):
         """
@@ -64,6 +67,28 @@ class PullDB:
         raise NotImplementedError
 
 
+def build_service(credentials, api_endpoint: str = None):
+    """Crea un cliente de la API de Google Sheets, con timeout.
+
+    Args:
+      credentials: credenciales de Google (p.ej. de una service account).
+      api_endpoint: URL alternativa de la API (p.ej. un servidor local).
+    """
+    # Imports costosos, que solo se necesitan al usar la API.
+    import httplib2  # type: ignore
+
+    from google_auth_httplib2 import AuthorizedHttp  # type: ignore
+    from googleapiclient import discovery  # type: ignore
+
+    http = httplib2.Http(timeout=TIMEOUTS["sheets"])
+    return discovery.build(
+        "sheets",
+        "v4",
+        http=AuthorizedHttp(credentials, http=http),
+        client_options={"api_endpoint": api_endpoint} if api_endpoint else None,
+    )
+
+
 def parse_sheets(sheet_ranges: List[Dict]) -> Dict[str, List[List[str]]]:
     """Segrega por hoja la lista de rango/valores obtenidos.
 
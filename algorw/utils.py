@@ -1,41 +1,60 @@
 from base64 import b64encode
 from email.message import Message
 from email.utils import parseaddr
+from functools import partial
 from smtplib import SMTP
-from typing import List
+from typing import TYPE_CHECKING, List
 
-from google.auth.transport.requests import Request  # type: ignore
-from google.oauth2.credentials import Credentials  # type: ignore
+from algorw.common.resilience import TIMEOUTS, breaker
+from config import Settings, load_config
 
-from config import Settings
 
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials  # type: ignore
 
-def sendmail(message: Message, creds: Credentials):
+
+def sendmail(message: Message, creds: "Credentials"):
     """Envía un mensaje usando el SMTP de Gmail.
+
+    No se reintenta (para no enviar dos veces el mensaje), pero sí se deja de
+    intentar mientras el servidor falle (ver resilience.breaker).
     """
     _, sender = parseaddr(message["From"])
     xoauth2_tok = f"user={sender}\1" f"auth=Bearer {creds.token}\1\1"
     xoauth2_b64 = b64encode(xoauth2_tok.encode("ascii")).decode("ascii")
-    server = SMTP("smtp.gmail.com", 587)
-    server.ehlo()
-    server.starttls()
-    server.ehlo()  # Se necesita EHLO de nuevo tras STARTTLS.
-    server.docmd("AUTH", "XOAUTH2 " + xoauth2_b64)
-    server.send_message(message)
-    server.close()
+    cfg = load_config()
+
+    def send():
+        server = SMTP(cfg.smtp_host, cfg.smtp_port, timeout=TIMEOUTS["smtp"])
+        try:
+            server.ehlo()
+            server.starttls()
+            server.ehlo()  # Se necesita EHLO de nuevo tras STARTTLS.
+            server.docmd("AUTH", "XOAUTH2 " + xoauth2_b64)
+            server.send_message(message)
+        finally:
+            server.close()
+
+    breaker("smtp").call(send)
 
 
 def get_oauth_credentials(cfg: Settings):
     """Devuelve nuestras credenciales OAuth.
     """
+    # Se importan aquí por su costo: solo las necesita quien envía mail.
+    from google.auth.transport.requests import Request  # type: ignore
+    from google.oauth2.credentials import Credentials  # type: ignore
+
     creds = Credentials(
         token=None,
         client_id=cfg.oauth_client_id,
         client_secret=cfg.oauth_client_secret.get_secret_value(),
         refresh_token=cfg.oauth_refresh_token.get_secret_value(),
-        token_uri="https://accounts.google.com/o/oauth2/token",
+        token_uri=cfg.oauth_token_uri,
     )
-    creds.refresh(Request())  # FIXME: catch UserAccessTokenError.
+    request = partial(Request(), timeout=TIMEOUTS["google_oauth"])
+    # FIXME: catch UserAccessTokenError.
+    breaker("google_oauth").call(creds.refresh, request)
     return creds
 
 
@@ -1,11 +1,15 @@
+import logging
+import os
+import threading
+
 from datetime import timedelta
 from enum import Enum
 from functools import lru_cache
-from typing import Dict
+from typing import Dict, Optional, Tuple, cast
 
 import yaml
 
-from pydantic import BaseSettings, NameEmail, SecretStr
+from pydantic import BaseSettings, NameEmail, SecretStr, ValidationError
 
 
 class Modalidad(str, Enum):
@@ -19,6 +23,7 @@ class Settings(BaseSettings):
     title: str
     sender: NameEmail
     job_queue: str = "default"
+    max_backlog: int = 100  # Entregas en cola a partir de las cuales se posterga.
 
     spreadsheet_id: str
     planilla_ttl: timedelta
@@ -34,16 +39,115 @@ class Settings(BaseSettings):
     recaptcha_site_id: str
     recaptcha_secret: SecretStr
 
+    # Token para descargar las entregas de un TP (ver main.export); sin él,
+    # la exportación queda deshabilitada.
+    export_token: Optional[SecretStr] = None
+
+    # Servicios externos; se pueden reemplazar por servidores locales para
+    # probar timeouts y fallas (ver algorw/common/resilience.py).
+    recaptcha_url: str = "https://www.google.com/recaptcha/api/siteverify"
+    oauth_token_uri: str = "https://accounts.google.com/o/oauth2/token"
+    smtp_host: str = "smtp.gmail.com"
+    smtp_port: int = 587
+
+
+class ReloadableSettings:
+    """Configuración que se puede recargar sin reiniciar el proceso.
+
+    Los atributos se leen de la instancia de Settings vigente, que se
+    reemplaza de manera atómica (una sola asignación) al recargar. Así, leer la
+    configuración sigue siendo inmediato, y quien lee varios atributos en una
+    misma operación puede tomar primero una copia con current().
+
+    reload_if_changed() solo hace un stat() del archivo si no cambió, y si el
+    nuevo YAML no es válido se conserva la configuración anterior.
+
+    Nota: algunos valores se usan una sola vez al iniciar, y para cambiarlos sí
+    hay que reiniciar: job_queue (ver algorw/app/queue.py) y planilla_ttl (ver
+    planilla.py).
+    """
+
+    def __init__(self, path: str, env_file: str):
+        self._path = path
+        self._env_file = env_file
+        self._lock = threading.Lock()
+        self._mtime_ns, self._settings = self._load()
+
+    def current(self) -> Settings:
+        return self._settings
+
+    def reload_if_changed(self) -> bool:
+        """Recarga la configuración si cambió el archivo.
+
+        Returns:
+          True si se recargó la configuración.
+        """
+        try:
+            mtime_ns = os.stat(self._path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime_ns == self._mtime_ns:
+            return False
+        return self.reload()
+
+    def reload(self) -> bool:
+        """Lee y valida de nuevo el archivo, y reemplaza la configuración.
+        """
+        with self._lock:
+            # Se toma la fecha antes de leer: si el archivo cambia mientras
+            # tanto, el próximo reload_if_changed() lo vuelve a leer.
+            mtime_ns = _mtime_ns(self._path)
+            try:
+                _, settings = self._load()
+            except (OSError, yaml.YAMLError, ValidationError) as ex:
+                # Para no reintentar hasta que el archivo vuelva a cambiar.
+                self._mtime_ns = mtime_ns
+                logging.getLogger("entregas").error(f"{self._path} inválido: {ex}")
+                return False
+            self._settings = settings
+            self._mtime_ns = mtime_ns
+            logging.getLogger("entregas").info(f"{self._path}: configuración recargada")
+            return True
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._settings, name)
+
+    def __setattr__(self, name, value):
+        if name.startswith("_"):
+            super().__setattr__(name, value)
+        else:
+            setattr(self._settings, name, value)
+
+    def _load(self) -> Tuple[Optional[int], Settings]:
+        # FIXME: estaría mejor si las variables de entorno pudieran tomar
+        # precedencia sobre la configuración en YAML (ver el orden de prioridad en
+        # https://pydantic-docs.helpmanual.io/usage/settings/#field-value-priority).
+        mtime_ns = _mtime_ns(self._path)
+        with open(self._path) as yml:
+            return mtime_ns, Settings(**yaml.safe_load(yml), _env_file=self._env_file)
+
+
+def _mtime_ns(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
 
 @lru_cache
-def load_config():
+def load_config() -> Settings:
     """Carga la configuración de un archivo YAML.
 
     Returns:
-       un objeto de tipo Settings, validado.
+       un objeto con los atributos de Settings, validado, que se actualiza con
+       reload_if_changed() (ver ReloadableSettings).
+    """
+    return cast(Settings, ReloadableSettings("entregas.yml", env_file=".secrets"))
+
+
+def reload_if_changed() -> bool:
+    """Recarga entregas.yml si cambió desde la última vez que se leyó.
     """
-    # FIXME: estaría mejor si las variables de entorno pudieran tomar
-    # precedencia sobre la configuración en YAML (ver el orden de prioridad en
-    # https://pydantic-docs.helpmanual.io/usage/settings/#field-value-priority).
-    with open("entregas.yml") as yml:
-        return Settings(**yaml.safe_load(yml), _env_file=".secrets")
+    return cast(ReloadableSettings, load_config()).reload_if_changed()
@@ -1,7 +1,10 @@
 import collections
+import hmac
 import io
 import logging
 import pathlib
+import re
+import uuid
 import zipfile
 
 from email import encoders
@@ -11,19 +14,20 @@ from email.mime.text import MIMEText
 from email.utils import formatdate, make_msgid
 from typing import List, Optional
 
-import requests
-
-from flask import Flask, render_template, request
+from flask import Flask, Response, jsonify, render_template, request
 from flask_caching import Cache  # type: ignore
-from werkzeug.exceptions import FailedDependency, HTTPException
+from rq.exceptions import NoSuchJobError  # type: ignore
+from rq.job import Job  # type: ignore
+from werkzeug.exceptions import FailedDependency, Forbidden, HTTPException, NotFound
 from werkzeug.utils import secure_filename
 
 from algorw import utils
-from algorw.app.queue import task_queue
-from algorw.app.tasks import corregir_entrega  # TODO: importar from corrector.
+from algorw.app.queue import enqueue_task, redis_conn
+from algorw.common import events, timing, traces
+from algorw.common.resilience import TIMEOUTS, CircuitOpenError, breaker
 from algorw.common.tasks import CorrectorTask
 from algorw.models import Alumne, Docente
-from config import Modalidad, Settings, load_config
+from config import Modalidad, Settings, load_config, reload_if_changed
 from planilla import fetch_planilla, timer_planilla
 
 
@@ -38,7 +42,11 @@ cache.init_app(app)
 timer_planilla.start()
 
 File = collections.namedtuple("File", ["content", "filename"])
+
+# La función se encola por nombre, para no importar el corrector en la app web.
+CORREGIR_ENTREGA = "algorw.app.tasks.corregir_entrega"
 EXTENSIONES_ACEPTADAS = {"zip"}  # TODO: volver a aceptar archivos sueltos.
+JOB_ID_REGEX = re.compile(r"^[0-9a-f]{32}$")
 
 
 class InvalidForm(Exception):
@@ -46,6 +54,12 @@ class InvalidForm(Exception):
     """
 
 
+@app.before_request
+def refresh_config():
+    # Habilitar una entrega no requiere reiniciar: basta con editar entregas.yml.
+    reload_if_changed()
+
+
 @app.context_processor
 def inject_cfg():
     return {"cfg": cfg}
@@ -79,6 +93,16 @@ def warn_and_render(ex):
     return render_template("result.html", error=ex), 422  # Unprocessable Entity
 
 
+@app.errorhandler(CircuitOpenError)
+def service_unavailable(ex):
+    """Un servicio externo está fallando: se responde de inmediato con 503.
+    """
+    logging.warn(f"CircuitOpenError: {ex}")
+    error = f"{ex}; por favor, intentá de nuevo en unos minutos."
+    headers = {"Retry-After": str(max(1, round(ex.retry_after)))}
+    return render_template("result.html", error=error), 503, headers
+
+
 def archivo_es_permitido(nombre):
     return "." in nombre and nombre.rsplit(".", 1)[1].lower() in EXTENSIONES_ACEPTADAS
 
@@ -143,9 +167,17 @@ def oauth_credentials():
 
 @app.route("/", methods=["POST"])
 def post():
+    """Recibe una entrega, midiendo sus etapas en una nueva traza.
+    """
+    with timing.trace(uuid.uuid4().hex):
+        return recibir_entrega()
+
+
+def recibir_entrega():
     # Leer valores del formulario.
     try:
-        validate_captcha()
+        with timing.span("captcha"):
+            validate_captcha()
         tp = request.form["tp"]
         files = get_files()
         body = request.form["body"] or ""
@@ -155,11 +187,13 @@ def post():
         raise InvalidForm(f"Formulario inválido sin campo {ex.args[0]!r}") from ex
 
     # Obtener alumnes que realizan la entrega.
-    planilla = fetch_planilla()
-    try:
-        alulist = planilla.get_alulist(identificador)
-    except KeyError as ex:
-        raise InvalidForm(f"No se encuentra grupo o legajo {identificador!r}") from ex
+    with timing.span("planilla"):
+        planilla = fetch_planilla()
+        try:
+            alulist = planilla.get_alulist(identificador)
+        except KeyError as ex:
+            msg = f"No se encuentra grupo o legajo {identificador!r}"
+            raise InvalidForm(msg) from ex
 
     # Validar varios aspectos de la entrega.
     if tp not in cfg.entregas:
@@ -218,9 +252,15 @@ def post():
         zipfile=entrega.content,
         orig_headers=dict(email.items()),
         repo_relpath=relpath_base / "_".join(legajos),
+        job_id=uuid.uuid4().hex,
+        trace_id=timing.current_trace(),
     )
 
-    task_queue.enqueue(corregir_entrega, task)
+    traces.set_legajos(task.trace_id, legajos)
+    with timing.span("enqueue"):
+        queue_status = enqueue_task(
+            CORREGIR_ENTREGA, task, tp_id=tp_id, job_id=task.job_id
+        )
 
     if not cfg.test:
         # TODO: en lugar de enviar un mail, que es lento, hacer un commit en la
@@ -230,24 +270,100 @@ def post():
     return render_template(
         "result.html",
         tp=tp,
+        job_id=task.job_id,
+        queue_status=queue_status,
         email="\n".join(f"{k}: {v}" for k, v in email.items()) if cfg.test else None,
     )
 
 
-def validate_captcha():
-    resp = requests.post(
-        "https://www.google.com/recaptcha/api/siteverify",
-        data={
-            "secret": cfg.recaptcha_secret.get_secret_value(),
-            "remoteip": request.remote_addr,
-            "response": request.form["g-recaptcha-response"],
-        },
+@app.route("/job/<job_id>", methods=["GET"])
+def job_status(job_id):
+    """Estado de un trabajo de corrección en la cola, y sus eventos de progreso.
+
+    Con el parámetro `after`, se incluyen los eventos posteriores a ese número
+    de secuencia (ver algorw.common.events). La página de resultado consulta
+    esta ruta periódicamente: cada consulta responde de inmediato, en lugar de
+    ocupar un thread de uWSGI mientras dura la corrección.
+    """
+    if not JOB_ID_REGEX.match(job_id):
+        raise NotFound(f"No existe el trabajo {job_id}")
+
+    after = request.args.get("after", "")
+    job_events = events.history(job_id, after=int(after)) if after.isdigit() else []
+    if (status := get_job_status(job_id)) is None and not job_events:
+        raise NotFound(f"No existe el trabajo {job_id}")
+
+    return jsonify(
+        status=status or "unknown",
+        events=[event._asdict() for event in job_events],
     )
 
-    if resp.ok:
-        json = resp.json()
-    else:
+
+@app.route("/export/<tp>", methods=["GET"])
+def export(tp):
+    """Descarga, como ZIP, la última entrega de cada alumne de un TP.
+
+    Requiere el token de exportación (cfg.export_token) como "Authorization:
+    Bearer <token>". Parámetros opcionales: cuatri, docente.
+    """
+    from algorw.corrector import export as corrector_export  # Requiere CORRECTOR_ROOT.
+
+    check_export_token()
+    try:
+        base_dir = corrector_export.entregas_dir(
+            tp.lower(), request.args.get("cuatri", cfg.cuatri)
+        )
+    except ValueError as ex:
+        raise NotFound(str(ex)) from ex
+    if not base_dir.is_dir():
+        raise NotFound(f"No hay entregas de {tp}")
+
+    keep = None
+    if docente := request.args.get("docente"):
+        keep = corrector_export.docente_filter(fetch_planilla().correctores, docente)
+
+    filename = f"{tp.lower()}_{base_dir.name}.zip"
+    return Response(
+        corrector_export.stream_zip(corrector_export.iter_files(base_dir, keep)),
+        mimetype="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+def check_export_token():
+    # Un EXPORT_TOKEN vacío (o en blanco) también deshabilita la exportación.
+    if cfg.export_token is None or not cfg.export_token.get_secret_value().strip():
+        raise NotFound("La exportación no está habilitada")
+    expected = f"Bearer {cfg.export_token.get_secret_value()}"
+    received = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(received.encode(), expected.encode()):
+        raise Forbidden("Token de exportación inválido")
+
+
+def get_job_status(job_id: str) -> Optional[str]:
+    try:
+        return Job.fetch(job_id, connection=redis_conn).get_status()
+    except NoSuchJobError:
+        return None
+
+
+def validate_captcha():
+    import requests  # Import costoso, que solo se necesita al hacer una entrega.
+
+    def verify():
+        resp = requests.post(
+            cfg.recaptcha_url,
+            data={
+                "secret": cfg.recaptcha_secret.get_secret_value(),
+                "remoteip": request.remote_addr,
+                "response": request.form["g-recaptcha-response"],
+            },
+            timeout=TIMEOUTS["recaptcha"],
+        )
         resp.raise_for_status()  # Lanza excepción descriptiva para 4xx y 5xx.
+        return resp.json()
+
+    json = breaker("recaptcha").call(verify)
 
     if not json["success"]:
         msg = ", ".join(json.get("error-codes", ["unknown error"]))
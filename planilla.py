@@ -4,8 +4,6 @@ import time
 
 import cachetools.func  # type: ignore
 
-from google.oauth2.service_account import Credentials  # type: ignore
-
 from algorw.planilla import Hojas, Planilla
 from algorw.sheets import Config
 from config import load_config
@@ -20,6 +18,9 @@ cfg = load_config()
 
 @cachetools.func.ttl_cache(maxsize=1, ttl=cfg.planilla_ttl.seconds)
 def fetch_planilla():
+    # Import costoso; se hace aquí, en el hilo de background_fetch, y no al iniciar.
+    from google.oauth2.service_account import Credentials  # type: ignore
+
     logging.getLogger("entregas").info("Fetching planilla")
     credentials = Credentials.from_service_account_file(
         cfg.service_account_jsonfile,
@@ -0,0 +1,64 @@
+"""Configuración común de las pruebas.
+
+Los módulos del corrector leen su configuración del entorno al importarse, por
+lo que se la define aquí, antes de importarlos, apuntando a un directorio
+temporal. Las pruebas no requieren Redis ni servicios externos.
+"""
+
+import os
+import pathlib
+import subprocess
+import tempfile
+
+import pytest
+
+
+ROOT_DIR = pathlib.Path(tempfile.mkdtemp(prefix="entregas_tests_"))
+
+os.environ.update(
+    {
+        "CORRECTOR_ROOT": str(ROOT_DIR),
+        "CORRECTOR_SKEL": "skel",
+        "CORRECTOR_TPS": "entregas",
+        "CORRECTOR_WORKER": "worker",
+        "CORRECTOR_GH_REPO": "algorw/algo2_entregas",
+        "CORRECTOR_GH_TOKEN": "x",
+        "CORRECTOR_GH_USER": "x",
+        "CORRECTOR_SHARDING": "",
+        "GIT_AUTHOR_NAME": "pruebas",
+        "GIT_AUTHOR_EMAIL": "pruebas@localhost",
+        "GIT_COMMITTER_NAME": "pruebas",
+        "GIT_COMMITTER_EMAIL": "pruebas@localhost",
+    }
+)
+for key in (
+    "OAUTH_CLIENT_ID",
+    "OAUTH_CLIENT_SECRET",
+    "OAUTH_REFRESH_TOKEN",
+    "RECAPTCHA_SITE_ID",
+    "RECAPTCHA_SECRET",
+):
+    os.environ.setdefault(key, "x")
+
+
+@pytest.fixture
+def corrector_sandbox(tmp_path, monkeypatch):
+    """Repositorio de entregas y base de TPs vacíos, en un directorio temporal.
+
+    Devuelve el corrector, ya configurado para usarlos: el worker es
+    `tmp_path / "worker"`, y la respuesta por mail solo se imprime.
+    """
+    from algorw.corrector import corrector, pusher, shards
+
+    entregas = tmp_path / "entregas"
+    subprocess.run(["git", "init", "-q", entregas], check=True)
+    (tmp_path / "skel" / "pila").mkdir(parents=True)
+
+    monkeypatch.setattr(corrector, "DATA_DIR", entregas)
+    monkeypatch.setattr(shards, "DATA_DIR", entregas)
+    monkeypatch.setattr(shards, "SHARDING", "")
+    monkeypatch.setattr(corrector, "SKEL_DIR", tmp_path / "skel")
+    monkeypatch.setattr(corrector, "WORKER_BIN", tmp_path / "worker")
+    monkeypatch.setattr(corrector.cfg, "test", True)
+    monkeypatch.setattr(pusher, "request_push", lambda repo_dir, **kwargs: None)
+    return corrector
@@ -0,0 +1,34 @@
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+
+from algorw.corrector import committer
+
+
+def git(repo, *args):
+    return subprocess.run(
+        ["git", *args], cwd=repo, check=True, capture_output=True, encoding="utf-8"
+    ).stdout
+
+
+def test_commits_concurrentes_actualizan_el_indice(tmp_path):
+    repo = tmp_path / "entregas"
+    git(tmp_path, "init", "-q", str(repo))
+    entregas = []
+    for legajo in range(8):
+        entrega_dir = repo / "pila" / "2020_1" / str(legajo)
+        entrega_dir.mkdir(parents=True)
+        (entrega_dir / "pila.c").write_text(f"// {legajo}\n")
+        entregas.append(entrega_dir)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        shas = list(
+            pool.map(
+                lambda d: committer.commit(d, f"{d.name}\n", "2020-04-01T12:00"),
+                entregas,
+            )
+        )
+
+    assert None not in shas
+    assert len(git(repo, "rev-list", "HEAD").split()) == len(entregas)
+    assert git(repo, "status", "--porcelain") == ""
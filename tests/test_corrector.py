@@ -0,0 +1,60 @@
+import io
+import os
+import pathlib
+import subprocess
+import zipfile
+
+from email.utils import formatdate
+
+from algorw.common.tasks import CorrectorTask
+
+
+def make_task(files):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zip_obj:
+        for name, contents in files.items():
+            zip_obj.writestr(name, contents)
+    return CorrectorTask(
+        tp_id="pila",
+        legajos=["54321"],
+        zipfile=buf.getvalue(),
+        orig_headers={
+            "Subject": "Pila - 54321 - Alumne",
+            "Date": formatdate(),
+            "Message-ID": "<prueba@localhost>",
+        },
+        repo_relpath=pathlib.PurePath("pila/2020_1/54321"),
+    )
+
+
+def test_worker_que_termina_antes_de_leer_la_entrada(corrector_sandbox, tmp_path):
+    corrector = corrector_sandbox
+    worker = tmp_path / "worker"
+    worker.write_text("#!/bin/sh\necho 'ERROR: el worker terminó'\n")
+    worker.chmod(0o755)
+
+    # Un archivo más grande que el buffer del pipe, para que el worker termine
+    # antes de recibir los siguientes.
+    files = {
+        "pila.c": "int main(void) { return 0; }\n",
+        "datos.bin": os.urandom(1 << 20),
+        "pila.h": "#include <stdbool.h>\n",
+    }
+    corrector.procesar_entrega(make_task(files))
+
+    entrega_dir = corrector.DATA_DIR / "pila/2020_1/54321"
+    for name, contents in files.items():
+        path = entrega_dir / name
+        assert path.exists(), name
+        expected = contents if isinstance(contents, bytes) else contents.encode()
+        assert path.read_bytes() == expected
+
+    committed = subprocess.run(
+        ["git", "ls-tree", "-r", "--name-only", "HEAD", "--", "pila/2020_1/54321"],
+        cwd=corrector.DATA_DIR,
+        check=True,
+        capture_output=True,
+        encoding="utf-8",
+    ).stdout.split()
+    for name in files:
+        assert f"pila/2020_1/54321/{name}" in committed
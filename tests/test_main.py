@@ -0,0 +1,26 @@
+import pytest
+
+from pydantic import SecretStr
+
+import main
+
+
+@pytest.mark.parametrize("token", [None, "", "  "])
+def test_export_deshabilitado_sin_token(monkeypatch, token):
+    monkeypatch.setattr(
+        main.cfg, "export_token", None if token is None else SecretStr(token)
+    )
+    client = main.app.test_client()
+
+    response = client.get("/export/pila", headers={"Authorization": "Bearer "})
+
+    assert response.status_code == 404
+
+
+def test_export_token_invalido(monkeypatch):
+    monkeypatch.setattr(main.cfg, "export_token", SecretStr("secreto"))
+    client = main.app.test_client()
+
+    response = client.get("/export/pila", headers={"Authorization": "Bearer otro"})
+
+    assert response.status_code == 403
@@ -0,0 +1,30 @@
+import json
+import pathlib
+
+from algorw.common.resilience import CircuitOpenError
+from algorw.corrector import sync_tp
+from algorw.corrector.alu_repos import AluRepo
+
+
+def test_circuito_abierto_no_interrumpe_la_sincronizacion(tmp_path, monkeypatch):
+    def sync_one(entrega_dir, alu_repo, tp_id):
+        if alu_repo.repo_full == "algorw-alu/falla":
+            raise CircuitOpenError("github", 60)
+
+    monkeypatch.setattr(sync_tp, "sync_one", sync_one)
+    pending = [
+        (pathlib.Path(legajo), AluRepo(repo_full, [legajo], []))
+        for legajo, repo_full in [
+            ("1", "algorw-alu/ok1"),
+            ("2", "algorw-alu/falla"),
+            ("3", "algorw-alu/ok3"),
+        ]
+    ]
+    state_path = tmp_path / "state.json"
+
+    failures = sync_tp.sync_all(pending, "pila", sync_tp.SyncState(state_path))
+
+    assert [repo_full for repo_full, _ in failures] == ["algorw-alu/falla"]
+    state = json.loads(state_path.read_text())
+    assert state["done"] == ["1", "3"]
+    assert set(state["failed"]) == {"2"}